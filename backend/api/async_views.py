@@ -0,0 +1,59 @@
+"""Асинхронная обработка запросов чтения под ASGI-воркером.
+
+По умолчанию сервер работает через WSGI; ASGI включается файлом
+infra/docker-compose.asgi.yml.
+
+Маршруты вьюсета, в которых есть действие из async_actions, отдаются
+Django как асинхронные вьюхи. Такие действия выполняются методом
+a<действие> в цикле событий. Асинхронно по-настоящему только то, что не
+ходит в базу: проверка ETag и ответ из общего кеша для списка и карточки
+рецепта. Промах кеша собирает ответ синхронным кодом DRF за один переход
+в поток (sync_to_async), а асинхронный ORM Django 4.2 сам работает через
+sync_to_async, так что для запросов к базе выигрыша нет. Поэтому
+действия, которые без базы не отвечают, сюда не включаются. Прочие
+методы тех же маршрутов (запись, загрузка файлов) выполняются как
+раньше, синхронно.
+Под WSGI Django вызывает такие вьюхи через async_to_sync, поэтому ответы
+в обоих режимах одинаковые.
+"""
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.utils.decorators import classonlymethod
+
+
+class AsyncReadMixin:
+    async_actions = ()
+    async_route = False
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        async_route = any(
+            action in cls.async_actions for action in (actions or {}).values())
+        view = super().as_view(actions, async_route=async_route, **initkwargs)
+        return markcoroutinefunction(view) if async_route else view
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.async_route:
+            return super().dispatch(request, *args, **kwargs)
+        if self.action_map.get(request.method.lower()) in self.async_actions:
+            return self.adispatch(request, *args, **kwargs)
+        return sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch, в котором обработчик — корутина."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # Аутентификация и проверка прав могут обращаться к базе.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = getattr(self, f'a{self.action}', None)
+            if handler is None:
+                handler = sync_to_async(getattr(self, self.action))
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,59 @@
+"""Аутентификация по токену с кешем «токен → пользователь».
+
+TokenAuthentication на каждый запрос делает JOIN токена с пользователем.
+Здесь результат хранится в ограниченном LRU процесса (TOKEN_CACHE_SIZE
+записей, не дольше TOKEN_CACHE_TTL секунд), а с TOKEN_CACHE_SHARED ещё и
+в общем кеше Django, чтобы им пользовались все воркеры. Каждая запись
+помнит версию пользователя (api.cache): выход через djoser, смена пароля,
+деактивация и любое сохранение пользователя меняют версию (api/signals.py),
+и запись сразу перестаёт приниматься во всех процессах.
+
+Запрос получает копию пользователя: то, что view допишет в request.user,
+не должно попасть в кеш и в соседние запросы.
+"""
+import copy
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from rest_framework.authentication import TokenAuthentication
+
+from . import cache, metrics
+from .lru import LRUCache
+
+
+def auth_key(user_id):
+    return f'auth:{user_id}'
+
+
+def shared_key(key):
+    return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+tokens = LRUCache('TOKEN_CACHE_SIZE', 'TOKEN_CACHE_TTL')
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        shared = getattr(settings, 'TOKEN_CACHE_SHARED', False)
+        entry = tokens.get(key)
+        if entry is None and shared:
+            entry = shared_cache.get(shared_key(key))
+        if entry is not None:
+            user, token, version = entry
+            if cache.get_versions([auth_key(user.pk)]) == [version]:
+                tokens.set(key, entry)
+                metrics.cache_result('token', True)
+                return copy.copy(user), token
+            tokens.delete(key)
+        metrics.cache_result('token', False)
+        user, token = super().authenticate_credentials(key)
+        # Изменение, закоммиченное между запросом к базе и чтением версии,
+        # запись не отменит, но она всё равно проживёт не дольше TTL.
+        version, = cache.get_versions([auth_key(user.pk)])
+        entry = (user, token, version)
+        tokens.set(key, entry)
+        if shared:
+            shared_cache.set(shared_key(key), entry,
+                             getattr(settings, 'TOKEN_CACHE_TTL', 60))
+        return copy.copy(user), token
@@ -0,0 +1,137 @@
+"""Версионированный кеш ответов и условные GET-запросы для чтения рецептов.
+
+Каждый ответ определяется набором счётчиков версий в кеше Django:
+общий для списка рецептов, отдельный для каждого рецепта, для профилей
+авторов, для справочника ингредиентов и для «состояния» пользователя
+(избранное, корзина, подписки). Запись в любую из этих сущностей меняет
+версию (см. api/signals.py), а значит и ETag, поэтому старые ответы
+просто перестают находиться в кеше.
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+
+RECIPES = 'recipes'
+AUTHORS = 'authors'
+INGREDIENTS = 'ingredients'
+SCORES = 'scores'
+
+
+def recipe_key(pk):
+    return f'recipe:{pk}'
+
+
+def user_state_key(pk):
+    return f'user-state:{pk}'
+
+
+def _missing_versions(keys, values):
+    missing = [key for key in keys if f'version:{key}' not in values]
+    # Вытесненная из кеша версия начинается заново, а не с нуля,
+    # иначе ETag мог бы совпасть с ответом, закешированным до записи.
+    version = time.time_ns()
+    return {f'version:{key}': version for key in missing}
+
+
+def get_versions(keys):
+    values = cache.get_many([f'version:{key}' for key in keys])
+    missing = _missing_versions(keys, values)
+    if missing:
+        cache.set_many(missing, None)
+        values.update(missing)
+    return [values[f'version:{key}'] for key in keys]
+
+
+async def aget_versions(keys):
+    values = await cache.aget_many([f'version:{key}' for key in keys])
+    missing = _missing_versions(keys, values)
+    if missing:
+        await cache.aset_many(missing, None)
+        values.update(missing)
+    return [values[f'version:{key}'] for key in keys]
+
+
+def _set_versions(keys):
+    version = time.time_ns()
+    cache.set_many({f'version:{key}': version for key in keys}, None)
+
+
+def bump(*keys):
+    """Меняет версии сразу и ещё раз после коммита транзакции.
+
+    Повторная смена после коммита не даёт параллельному запросу закешировать
+    старые данные под новой версией, пока транзакция не завершена.
+    """
+    _set_versions(keys)
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(_set_versions, keys))
+
+
+class VersionedCacheMixin:
+    """Отдаёт ETag и 304 Not Modified, кеширует данные ответа по ETag."""
+
+    @staticmethod
+    def _state(request):
+        user = request.user
+        return user_state_key(user.pk) if user.is_authenticated else 'anon'
+
+    @staticmethod
+    def _etag(request, state, versions):
+        return hashlib.sha1(
+            f'{request.get_full_path()}|{state}|{versions}'.encode()
+        ).hexdigest()
+
+    @staticmethod
+    def _finish(response, etag):
+        response['ETag'] = f'"{etag}"'
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    @staticmethod
+    def _not_modified(request, etag):
+        return f'"{etag}"' in request.headers.get('If-None-Match', '')
+
+    def cached_response(self, request, keys, build):
+        state = self._state(request)
+        etag = self._etag(request, state, get_versions([*keys, state]))
+        if self._not_modified(request, etag):
+            metrics.cache_result('response', True)
+            return self._finish(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        data = cache.get(f'response:{etag}')
+        metrics.cache_result('response', data is not None)
+        if data is not None:
+            return self._finish(Response(data), etag)
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(f'response:{etag}', response.data,
+                      getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        return self._finish(response, etag)
+
+    async def acached_response(self, request, keys, build):
+        """То же для асинхронных вьюх: build — корутина-функция."""
+        state = self._state(request)
+        etag = self._etag(request, state, await aget_versions([*keys, state]))
+        if self._not_modified(request, etag):
+            metrics.cache_result('response', True)
+            return self._finish(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        data = await cache.aget(f'response:{etag}')
+        metrics.cache_result('response', data is not None)
+        if data is not None:
+            return self._finish(Response(data), etag)
+        response = await build()
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(f'response:{etag}', response.data,
+                             getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300))
+        return self._finish(response, etag)
@@ -0,0 +1,88 @@
+"""Выборочные поля ответа: ?fields=a,b оставляет только перечисленные
+поля, ?omit=c,d убирает перечисленные.
+
+Список полей разбирается один раз на запрос и передаётся сериализатору
+через контекст (ключ 'fields'). По нему же вьюсеты решают, какие
+prefetch_related, select_related, аннотации и колонки нужны в запросе,
+так что неотданные поля не стоят и запросов к базе.
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+_readable = {}
+
+
+def readable_fields(serializer_class):
+    """Поля, которые сериализатор отдаёт, в порядке вывода."""
+    if hasattr(serializer_class, 'field_names'):
+        return serializer_class.field_names
+    if serializer_class not in _readable:
+        _readable[serializer_class] = tuple(
+            name for name, field in serializer_class().fields.items()
+            if not field.write_only)
+    return _readable[serializer_class]
+
+
+def _names(request, param, available):
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown:
+        raise ValidationError({param: (
+            f'Неизвестные поля: {", ".join(sorted(unknown))}. '
+            f'Доступны: {", ".join(available)}')})
+    return names
+
+
+def selected_fields(request, available):
+    """Поля из available, запрошенные клиентом, или None, если все."""
+    fields = _names(request, FIELDS_PARAM, available)
+    omit = _names(request, OMIT_PARAM, available)
+    if fields is None and omit is None:
+        return None
+    return tuple(name for name in available
+                 if (fields is None or name in fields)
+                 and (omit is None or name not in omit))
+
+
+class SparseFieldsMixin:
+    """Оставляет в ModelSerializer только поля из context['fields']."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                if not self.fields[name].write_only:
+                    self.fields.pop(name)
+
+
+class SparseFieldsViewMixin:
+    """Разбирает ?fields= и ?omit= для действий чтения из sparse_actions."""
+
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self, serializer_class=None):
+        if (self.request.method not in SAFE_METHODS
+                or self.action not in self.sparse_actions):
+            return None
+        serializer_class = serializer_class or self.get_serializer_class()
+        cache = self.__dict__.setdefault('_sparse_fields', {})
+        if serializer_class not in cache:
+            cache[serializer_class] = selected_fields(
+                self.request, readable_fields(serializer_class))
+        return cache[serializer_class]
+
+    def wants(self, name, serializer_class=None):
+        fields = self.get_sparse_fields(serializer_class)
+        return fields is None or name in fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_sparse_fields()
+        return context
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import ValidationError
+from recipes import ingredient_sets, scores, search
+from recipes.ingredient_index import index as ingredient_index
 from recipes.models import Recipe, User
 
 
@@ -8,9 +12,11 @@ class IngredientSearchFilter(SearchFilter):
 
     def filter_queryset(self, request, queryset, view):
         search_term = request.query_params.get(self.search_param)
-        if search_term:
-            return queryset.filter(name__istartswith=search_term)
-        return queryset.none()
+        if not search_term:
+            return queryset.none()
+        if getattr(view, 'action', None) == 'list':
+            return ingredient_index.search(search_term)
+        return queryset.filter(name__istartswith=search_term)
 
 
 class RecipeFilter(FilterSet):
@@ -20,10 +26,42 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart')
     is_favorited = filters.NumberFilter(
         method='filter_is_favorited')
+    search = filters.CharFilter(method='filter_search')
+    ingredients = filters.CharFilter(method='filter_ingredients')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in scores.RANKINGS],
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'is_favorited', 'is_in_shopping_cart', 'search',
+                  'ingredients', 'ordering')
+
+    def filter_ordering(self, queryset, name, value):
+        return scores.order(queryset, value)
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        try:
+            ingredient_ids = [int(pk) for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            raise ValidationError(
+                {'ingredients': 'Укажите id ингредиентов через запятую'})
+        if not all(0 < pk < 2 ** 63 for pk in ingredient_ids):
+            raise ValidationError(
+                {'ingredients': 'Неверный id ингредиента'})
+        limit = getattr(settings, 'INGREDIENT_FILTER_MAX_IDS', 50)
+        if len(set(ingredient_ids)) > limit:
+            raise ValidationError(
+                {'ingredients': f'Не более {limit} ингредиентов'})
+        mode = self.data.get('match', ingredient_sets.ALL)
+        if mode not in ingredient_sets.MODES:
+            raise ValidationError(
+                {'match': f'Допустимые значения: '
+                          f'{", ".join(ingredient_sets.MODES)}'})
+        return ingredient_sets.filter_recipes(queryset, ingredient_ids, mode)
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
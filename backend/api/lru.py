@@ -0,0 +1,51 @@
+"""Ограниченный кеш процесса с вытеснением давно не использованных записей."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class LRUCache:
+    """Потокобезопасный LRU с ограничением времени жизни записей.
+
+    Размер и время жизни читаются из настроек size_setting и ttl_setting
+    при каждой записи.
+    """
+
+    def __init__(self, size_setting, ttl_setting, size=1000, ttl=60):
+        self.size_setting = size_setting
+        self.ttl_setting = ttl_setting
+        self.default_size = size
+        self.default_ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        ttl = getattr(settings, self.ttl_setting, self.default_ttl)
+        size = getattr(settings, self.size_setting, self.default_size)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,81 @@
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?limit=6&cursor=',
+    '/api/ingredients/?name=с',
+)
+
+
+class Command(BaseCommand):
+    help = ('Load-test read endpoints of a running server. Run it against '
+            'the sync (foodgram.wsgi) and the ASGI (foodgram.asgi with '
+            'uvicorn_worker.UvicornWorker) deployment on the same host and '
+            'compare the throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000',
+                            help='Server to benchmark')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Endpoint to request, can be repeated')
+        parser.add_argument('--token',
+                            help='Auth token, adds /api/users/me/ and '
+                                 '/api/users/subscriptions/ to the defaults')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Number of simultaneous clients')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='Total number of requests')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or list(DEFAULT_PATHS)
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+            if not options['paths']:
+                paths += ['/api/users/me/', '/api/users/subscriptions/']
+        base_url = options['base_url'].rstrip('/')
+        urls = [base_url + paths[number % len(paths)]
+                for number in range(options['requests'])]
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=options['concurrency'],
+            pool_maxsize=options['concurrency'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def fetch(url):
+            started = perf_counter()
+            try:
+                response = session.get(
+                    url, headers=headers, timeout=options['timeout'])
+            except requests.RequestException:
+                return None, perf_counter() - started
+            return response.status_code, perf_counter() - started
+
+        try:
+            session.get(urls[0], headers=headers, timeout=options['timeout'])
+        except requests.RequestException as error:
+            raise CommandError(f'Server is not reachable: {error}')
+        started = perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, urls))
+        elapsed = perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for code, _ in results if code is None or code >= 400)
+        self.stdout.write(
+            f'{len(results)} requests, concurrency {options["concurrency"]}, '
+            f'{elapsed:.2f}s')
+        self.stdout.write(f'throughput: {len(results) / elapsed:.1f} req/s')
+        self.stdout.write(
+            f'latency: p50 {statistics.median(latencies) * 1000:.1f} ms, '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms, '
+            f'max {latencies[-1] * 1000:.1f} ms')
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(f'errors: {errors}'))
@@ -0,0 +1,74 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeListSerializer, RecipeReadSerializer
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, IngredientRecipe, Recipe, User
+
+
+class Command(BaseCommand):
+    help = ('Compare RecipeListSerializer + JSONRenderer with the fast read '
+            'path on generated recipes. The data is rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100,
+                            help='Recipes per serialization')
+        parser.add_argument('--ingredients', type=int, default=8,
+                            help='Ingredients per recipe')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = self.create_recipes(options['count'],
+                                          options['ingredients'])
+            request = Request(APIRequestFactory().get(
+                '/api/recipes/', HTTP_HOST=settings.ALLOWED_HOSTS[0]))
+            request.user = AnonymousUser()
+            view = RecipeViewSet(request=request, action='list',
+                                 format_kwarg=None)
+            queryset = list(view.get_queryset().filter(
+                id__in=[recipe.id for recipe in recipes]))
+            results = {}
+            for label, serializer_class, renderer in (
+                    ('drf', RecipeListSerializer, JSONRenderer()),
+                    ('fast', RecipeReadSerializer, FastJSONRenderer())):
+                started = perf_counter()
+                for _ in range(options['repeat']):
+                    renderer.render(serializer_class(
+                        queryset, many=True,
+                        context={'request': request}).data)
+                results[label] = (perf_counter() - started) / options['repeat']
+            transaction.set_rollback(True)
+        scale = 100 / options['count']
+        for label, seconds in results.items():
+            self.stdout.write(
+                f'{label}: {seconds * scale * 1000:.2f} ms per 100 recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'speedup: {results["drf"] / results["fast"]:.1f}x'))
+
+    def create_recipes(self, count, ingredients_count):
+        author = User.objects.create_user(
+            email='benchmark@foodgram.ru', username='benchmark-author',
+            password=None, first_name='Автор', last_name='Бенчмарка')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент бенчмарка {number}',
+                       measurement_unit='г')
+            for number in range(ingredients_count))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}',
+                   text='Описание рецепта ' * 20, cooking_time=30,
+                   image='recipe.png')
+            for number in range(count))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=100)
+            for recipe in recipes
+            for ingredient in ingredients)
+        return recipes
@@ -0,0 +1,187 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Каждый процесс копит счётчики и гистограммы в памяти и не чаще раза в
+METRICS_FLUSH_INTERVAL секунд сбрасывает их в свой файл в METRICS_DIR.
+Эндпоинт /metrics складывает файлы всех процессов, поэтому за ним видна
+сумма по всем воркерам gunicorn. Файлы завершившихся воркеров остаются,
+чтобы счётчики не убывали при перезапуске воркера. В имени файла кроме
+PID есть время запуска процесса: новый процесс с тем же PID не затрёт
+файл старого. Каталог очищает хук on_starting в gunicorn.conf.py при
+старте сервера, и Prometheus видит обычный сброс счётчиков.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'foodgram_requests_total': (
+        'counter', 'Обработанные запросы', None),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время обработки запроса', DURATION_BUCKETS),
+    'foodgram_request_db_queries': (
+        'histogram', 'Число SQL-запросов на запрос', QUERY_BUCKETS),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам приложения', None),
+    'foodgram_shopping_list_bytes': (
+        'histogram', 'Размер выгруженного списка покупок', SIZE_BUCKETS),
+}
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'foodgram-metrics')
+
+
+def label_key(labels):
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._flushed_at = 0.0
+        self._pid = None
+        self._started = None
+
+    def inc(self, name, labels, value=1):
+        key = label_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = label_key(labels)
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            histogram = series.setdefault(
+                key, {'buckets': [0] * (len(buckets) + 1), 'sum': 0, 'count': 0})
+            histogram['buckets'][bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self.maybe_flush()
+
+    def path(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # Первая запись в этом процессе, в том числе после fork.
+            self._pid, self._started = pid, time.time_ns()
+        return os.path.join(
+            metrics_dir(), f'metrics-{pid}-{self._started}.json')
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._values:
+                return
+            data = json.dumps(self._values, ensure_ascii=False)
+            self._flushed_at = time.monotonic()
+        path = self.path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись во временный файл и os.replace: читатель не увидит
+        # недописанный файл.
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as output:
+            output.write(data)
+        os.replace(temporary, path)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def clear():
+    """Удаляет файлы всех процессов: вызывается при старте сервера."""
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.startswith('metrics-') and filename.endswith('.json'):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                pass
+
+
+def collect():
+    """Сумма метрик всех процессов: {метрика: {метки: значение}}."""
+    registry.flush()
+    total = {}
+    directory = metrics_dir()
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('metrics-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename),
+                      encoding='utf-8') as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for name, series in data.items():
+            merged = total.setdefault(name, {})
+            for key, value in series.items():
+                if isinstance(value, dict):
+                    current = merged.setdefault(key, {
+                        'buckets': [0] * len(value['buckets']),
+                        'sum': 0, 'count': 0})
+                    current['buckets'] = [
+                        a + b for a, b in zip(current['buckets'],
+                                              value['buckets'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+                else:
+                    merged[key] = merged.get(key, 0) + value
+    return total
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render():
+    lines = []
+    data = collect()
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(data.get(name, {}).items()):
+            labels = [tuple(pair) for pair in json.loads(key)]
+            if kind == 'counter':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket'
+                             f'{format_labels([*labels, ("le", bound)])} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def cache_result(cache_name, hit):
+    registry.inc('foodgram_cache_requests_total',
+                 {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
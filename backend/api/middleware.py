@@ -0,0 +1,167 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics, timing
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """Отдаёт замеры запроса в Server-Timing и пишет лог медленных запросов.
+
+    Заголовок добавляется только с SERVER_TIMING (по умолчанию — при DEBUG).
+
+    view — время вьюхи вместе с запросами к базе и сериализацией,
+    serialize — время сериализаторов, render — сборка JSON, db — все
+    SQL-запросы, total — весь запрос. Запросы дольше SLOW_REQUEST_MS
+    попадают в лог одной JSON-строкой вместе с самыми частыми SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Синхронные хуки Django под ASGI вызывал бы через поток.
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = timing.RequestTimings()
+        token = timing.current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = timing.RequestTimings()
+        token = timing.current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        self.finish_view(timings)
+        total = time.perf_counter() - timings.started
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = self.header(timings, total)
+        threshold = getattr(settings, 'SLOW_REQUEST_MS', 500)
+        if threshold is not None and total * 1000 >= threshold:
+            logger.warning('slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                **{f'{name}_ms': round(seconds * 1000, 2)
+                   for name, seconds in timings.durations.items()},
+                'queries': timings.queries,
+                'serialize_queries': timings.serialize_queries,
+                'top_queries': timings.top_statements(),
+            }, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view()
+
+    # Ответы DRF рендерятся после этого хука, поэтому вьюха
+    # заканчивается здесь, а render считает сам рендерер.
+    def process_template_response(self, request, response):
+        self.end_view()
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        self.end_view()
+        return response
+
+    @staticmethod
+    def start_view():
+        timings = timing.current.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    @classmethod
+    def end_view(cls):
+        timings = timing.current.get()
+        if timings is not None:
+            cls.finish_view(timings)
+
+    @staticmethod
+    def finish_view(timings):
+        started = timings.view_started
+        if started is not None:
+            timings.add('view', time.perf_counter() - started)
+            timings.view_started = None
+
+    @staticmethod
+    def header(timings, total):
+        metrics = [
+            f'db;dur={timings.durations["db"] * 1000:.2f};'
+            f'desc="{timings.queries} queries"']
+        for name in ('view', 'serialize', 'render'):
+            if name in timings.durations:
+                metrics.append(f'{name};dur={timings.durations[name] * 1000:.2f}')
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+class MetricsMiddleware:
+    """Счётчики запросов, время ответа и число SQL-запросов по маршрутам.
+
+    Стоит после ServerTimingMiddleware, чтобы видеть замеры запроса.
+    Маршрут — имя URL-паттерна, а не путь: у /api/recipes/1/ и
+    /api/recipes/2/ одна метка recipe-detail.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    @staticmethod
+    def record(request, response, started):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        metrics.registry.inc('foodgram_requests_total', {
+            'route': route, 'method': request.method,
+            'status': str(response.status_code)})
+        metrics.registry.observe(
+            'foodgram_request_duration_seconds',
+            {'route': route, 'method': request.method},
+            time.perf_counter() - started)
+        timings = timing.current.get()
+        if timings is not None:
+            metrics.registry.observe(
+                'foodgram_request_db_queries', {'route': route},
+                timings.queries)
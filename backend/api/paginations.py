@@ -1,6 +1,156 @@
+import base64
+import json
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class ApiPagination(PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора (keyset).
+
+    Режим курсора включается параметром ?cursor= (пустое значение — первая
+    страница) на вьюсетах с атрибутом cursor_ordering, а для действий из
+    cursor_actions вьюсета — всегда. Если фильтры уже упорядочили выборку
+    вплоть до id (релевантность поиска, покрытие ингредиентов, рейтинг),
+    ключом курсора становится их порядок, иначе — cursor_ordering.
+    Страница выбирается условием WHERE по ключу сортировки вместо OFFSET,
+    COUNT(*) не считается, поэтому любая страница стоит столько же, сколько
+    первая. Форма ответа та же, только count равен null.
+    """
+
     page_size_query_param = "limit"
     page_size = 6
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        self.cursor_mode = bool(ordering and (
+            self.cursor_query_param in request.query_params
+            or getattr(view, 'action', None)
+            in getattr(view, 'cursor_actions', ())))
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering = self.get_cursor_ordering(queryset, ordering)
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering]
+        position, reverse = self.decode_cursor(request)
+        page_size = self.get_page_size(request)
+        if reverse:
+            order = [f'{"" if desc else "-"}{field}'
+                     for field, desc in self.ordering]
+        else:
+            order = list(ordering)
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            position = self.clean_position(queryset, position)
+            queryset = queryset.filter(self.after(position, reverse))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            first = self.position(results[0])
+            last = self.position(results[-1])
+            if reverse:
+                self.next_position = last if position is not None else None
+                self.previous_position = first if has_more else None
+            else:
+                self.next_position = last if has_more else None
+                self.previous_position = (
+                    first if position is not None else None)
+        elif position is not None:
+            # Пустая страница: ссылка обратно ведёт к исходной позиции.
+            if reverse:
+                self.next_position = position
+            else:
+                self.previous_position = position
+        return results
+
+    def get_cursor_ordering(self, queryset, default):
+        ordering = queryset.query.order_by
+        if (ordering and all(isinstance(field, str) for field in ordering)
+                and ordering[-1].lstrip('-') in ('id', 'pk')):
+            return tuple(ordering)
+        return default
+
+    def after(self, position, reverse):
+        """Строки, идущие строго после position в порядке сортировки."""
+        condition = Q()
+        equal = Q()
+        for (field, desc), value in zip(self.ordering, position):
+            lookup = 'lt' if desc != reverse else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def clean_position(self, queryset, position):
+        """Приводит значения курсора к типам полей сортировки."""
+        values = []
+        for (field, _), value in zip(self.ordering, position):
+            try:
+                if field in queryset.query.annotations:
+                    model_field = queryset.query.annotations[field].output_field
+                else:
+                    model_field = queryset.model._meta.get_field(field)
+                value = model_field.to_python(value)
+                # Границы целых полей проверяются не на всех базах.
+                if value is None or (isinstance(value, int)
+                                     and not -2 ** 63 <= value < 2 ** 63):
+                    raise ValueError(field)
+                model_field.run_validators(value)
+            except (FieldDoesNotExist, TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def position(self, instance):
+        values = attrgetter(*(field for field, _ in self.ordering))(instance)
+        if len(self.ordering) == 1:
+            values = (values,)
+        return [value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in values]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        if position is None:
+            return None
+        data = json.dumps({'p': position, 'r': int(reverse)},
+                          separators=(',', ':'))
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            base64.urlsafe_b64encode(data.encode()).decode())
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': None,
+            'next': self.encode_cursor(self.next_position, False),
+            'previous': self.encode_cursor(self.previous_position, True),
+            'results': data,
+        })
@@ -1,8 +1,15 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework.exceptions import ValidationError
-from recipes.models import (Recipe, Ingredient, IngredientRecipe, ShoppingCart, Favorite)
+from recipes import images, ingredient_sets, shopping_list
+from recipes.models import (Recipe, Ingredient, IngredientRecipe, ShoppingCart, Favorite,
+                            Follow)
 from users.serializers import UserSerializer
+from .timing import TimedSerializerMixin, serializing
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -43,7 +50,17 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'coocking_time')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class RecipeBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_SIZE)
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
@@ -64,7 +81,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = UserSerializer()
     ingredients = IngredientRecipeSerializer(
         many=True,
@@ -72,31 +89,145 @@ class RecipeListSerializer(serializers.ModelSerializer):
         read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'text', 'cooking_time', 'image_variants')
+
+    def get_image_variants(self, obj):
+        return images.variant_urls(
+            obj.image_variants, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if not user.is_anonymous:
-            return Favorite.objects.filter(recipe=obj).exists()
+            return Favorite.objects.filter(author=user, recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if not user.is_anonymous:
-            return ShoppingCart.objects.filter(recipe=obj).exists()
+            return ShoppingCart.objects.filter(author=user, recipe=obj).exists()
         return False
 
 
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """Быстрый путь чтения рецептов.
+
+    Отдаёт ровно то же, что RecipeListSerializer (это сверяет тест с
+    эталонным выводом), но собирает словари прямо из предзагруженных
+    объектов по заранее заданным спискам атрибутов, без обхода полей DRF.
+    Набор полей (context['fields'], см. api.fieldsets) выбирается один раз
+    на сериализатор, абсолютные URL картинок кешируются на то же время.
+    """
+
+    field_names = ('id', 'author', 'ingredients', 'is_favorited',
+                   'is_in_shopping_cart', 'name', 'image', 'text',
+                   'cooking_time', 'image_variants')
+    author_fields = attrgetter(
+        'email', 'id', 'username', 'first_name', 'last_name')
+    ingredient_fields = attrgetter('id', 'name', 'measurement_unit')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._urls = {}
+        fields = self.context.get('fields')
+        self._builders = tuple(
+            (name, getattr(self, f'get_{name}'))
+            for name in (self.field_names if fields is None else fields))
+
+    def absolute(self, url):
+        absolute = self._urls.get(url)
+        if absolute is None:
+            request = self.context.get('request')
+            absolute = request.build_absolute_uri(url) if request else url
+            self._urls[url] = absolute
+        return absolute
+
+    def file_url(self, file):
+        return self.absolute(file.url) if file else None
+
+    def variant_urls(self, variants):
+        return {
+            size_name: {extension: self.absolute(default_storage.url(path))
+                        for extension, path in formats.items()}
+            for size_name, formats in (variants or {}).items()}
+
+    def flag(self, recipe, name, model):
+        if hasattr(recipe, name):
+            return getattr(recipe, name)
+        user = self.context.get('request').user
+        if user.is_anonymous:
+            return False
+        return model.objects.filter(author=user, recipe=recipe).exists()
+
+    def get_id(self, recipe):
+        return recipe.id
+
+    def get_author(self, recipe):
+        author = recipe.author
+        email, pk, username, first_name, last_name = self.author_fields(author)
+        if hasattr(author, 'is_subscribed'):
+            is_subscribed = author.is_subscribed
+        else:
+            user = self.context.get('request').user
+            is_subscribed = not user.is_anonymous and Follow.objects.filter(
+                user=user, author=author).exists()
+        return {
+            'email': email, 'id': pk, 'username': username,
+            'first_name': first_name, 'last_name': last_name,
+            'avatar': self.file_url(author.avatar),
+            'is_subscribed': is_subscribed,
+            'avatar_variants': self.variant_urls(author.avatar_variants),
+        }
+
+    def get_ingredients(self, recipe):
+        fields = self.ingredient_fields
+        rows = []
+        for row in recipe.recipe_ingredients.all():
+            pk, name, measurement_unit = fields(row.ingredient)
+            rows.append({'id': pk, 'name': name,
+                         'measurement_unit': measurement_unit,
+                         'amount': row.amount})
+        return rows
+
+    def get_is_favorited(self, recipe):
+        return self.flag(recipe, 'is_favorited', Favorite)
+
+    def get_is_in_shopping_cart(self, recipe):
+        return self.flag(recipe, 'is_in_shopping_cart', ShoppingCart)
+
+    def get_name(self, recipe):
+        return recipe.name
+
+    def get_image(self, recipe):
+        return self.file_url(recipe.image)
+
+    def get_text(self, recipe):
+        return recipe.text
+
+    def get_cooking_time(self, recipe):
+        return recipe.cooking_time
+
+    def get_image_variants(self, recipe):
+        return self.variant_urls(recipe.image_variants)
+
+    def to_representation(self, recipe):
+        with serializing():
+            return {name: build(recipe) for name, build in self._builders}
+
+
 class AddIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient'
-    )
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeWriteSerializer.validate_ingredients.
+    id = serializers.IntegerField(source='ingredient')
     amount = serializers.IntegerField()
 
     class Meta:
@@ -109,7 +240,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = AddIngredientSerializer(
         many=True,
         write_only=True)
-    image = Base64ImageField()
+    image = images.Base64ImageField()
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault())
 
@@ -135,35 +266,88 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 raise ValidationError(
                     {'amount': 'Количество должно быть не более 32767'})
             ingredients_list.append(ingredient)
+        missing = set(ingredients_list).difference(
+            Ingredient.objects.filter(
+                id__in=ingredients_list).values_list('id', flat=True))
+        if missing:
+            raise ValidationError(
+                {'ingredients': 'Ингредиенты не найдены: '
+                                f'{", ".join(map(str, sorted(missing)))}'})
         return value
 
     def to_representation(self, instance):
         ingredients = super().to_representation(instance)
         ingredients['ingredients'] = IngredientRecipeSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredient'),
+            many=True).data
         return ingredients
 
-    def add_tags_ingredients(self, ingredients, model):
-        for ingredient in ingredients:
-            IngredientRecipe.objects.update_or_create(
-                recipe=model,
-                ingredient=ingredient['ingredient'],
-                amount=ingredient['amount'])
+    def add_ingredients(self, ingredients, model):
+        if not ingredients:
+            return
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=model,
+                             ingredient_id=ingredient['ingredient'],
+                             amount=ingredient['amount'])
+            for ingredient in ingredients)
+        ingredient_sets.postings_changed()
+
+    def update_ingredients(self, ingredients, model):
+        """Пишет только разницу между текущим и новым составом рецепта."""
+        current = {
+            row.ingredient_id: row for row in model.recipe_ingredients.all()}
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()}
+        new_amounts = {
+            item['ingredient']: item['amount'] for item in ingredients}
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = current.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        removed = [row.id for ingredient_id, row in current.items()
+                   if ingredient_id not in new_amounts]
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.add_ingredients(
+            [item for item in ingredients
+             if item['ingredient'] not in current], model)
+        shopping_list.recipe_ingredients_changed(
+            model, old_amounts, new_amounts)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
+        upload = images.detach_upload(Recipe, validated_data, 'image')
         recipe = super().create(validated_data)
-        self.add_tags_ingredients(ingredients, recipe)
+        self.add_ingredients(ingredients, recipe)
+        images.refresh_variants(
+            recipe, 'image', 'image_variants', 'recipe', upload)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.add_tags_ingredients(ingredients, instance)
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        upload = images.detach_upload(Recipe, validated_data, 'image')
+        if ingredients is not None:
+            self.update_ingredients(ingredients, instance)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            images.refresh_variants(
+                instance, 'image', 'image_variants', 'recipe', upload)
+        return instance
 
 
-class RecipeMiniSerializer(serializers.ModelSerializer):
+class RecipeMiniSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image',)
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_variants')
+
+    def get_image_variants(self, obj):
+        return images.variant_urls(
+            obj.image_variants, self.context.get('request'))
@@ -0,0 +1,127 @@
+import csv
+import json
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from . import metrics
+
+CHUNK_SIZE = 8192
+
+
+class ShoppingListContentNegotiation(DefaultContentNegotiation):
+    """?format= выбирает формат файла со списком покупок, а не рендерер DRF.
+
+    Ошибки (401, 400) по-прежнему отдаются первым рендерером вьюсета.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def render_txt(items):
+    today = date.today().strftime('%d-%m-%Y')
+    yield f'{today}\nСписок покупок\n\n'
+    for item in items:
+        yield (f'{item["ingredient__name"]}: {item["total_amount"]}'
+               f'{item["ingredient__measurement_unit"]}\n')
+    yield '\n\nFoodgram.2025'
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for item in items:
+        yield writer.writerow((item['ingredient__name'],
+                               item['total_amount'],
+                               item['ingredient__measurement_unit']))
+
+
+def render_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'amount': item['total_amount'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+}
+
+
+def buffered(parts, size=CHUNK_SIZE):
+    """Склеивает мелкие строки в куски по size байт перед отправкой.
+
+    Заголовок файла уходит клиенту сразу, не дожидаясь заполнения буфера.
+    """
+    parts = iter(parts)
+    for part in parts:
+        yield part.encode('utf-8')
+        break
+    buffer = []
+    length = 0
+    for part in parts:
+        data = part.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def measured(chunks, export_format):
+    """Передаёт куски дальше и записывает в метрики размер файла."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    metrics.registry.observe(
+        'foodgram_shopping_list_bytes', {'format': export_format}, size)
+
+
+async def aiterate(chunks):
+    """Тот же поток кусков для ASGI: по одному куску за переход в поток.
+
+    Синхронный итератор ASGI-обработчик Django сначала целиком собирает в
+    список, и файл отдавался бы только после чтения всего списка из базы.
+    Все куски читаются в потоке запроса, где открыт курсор.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def shopping_list_response(items, export_format, asynchronous=False):
+    content_type, render = FORMATS[export_format]
+    chunks = measured(buffered(render(items)), export_format)
+    response = StreamingHttpResponse(
+        aiterate(chunks) if asynchronous else chunks,
+        content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shop_list.{export_format}"')
+    return response
@@ -0,0 +1,109 @@
+"""Короткие ссылки на рецепты: /s/<код> → страница рецепта.
+
+Код — номер рецепта в base62, он хранится в таблице ShortLink вместе со
+счётчиком переходов. Переход по ссылке разрешается сначала в LRU процесса
+(SHORT_LINK_CACHE_SIZE записей, не дольше SHORT_LINK_CACHE_TTL секунд),
+затем в общем кеше Django и только потом в базе, так что популярная ссылка
+не стоит запросов к базе. Переходы копятся в памяти и раз в
+SHORT_LINK_FLUSH_INTERVAL секунд пишутся в базу одним UPDATE.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import DatabaseError
+from django.db.models import Case, F, Value, When
+
+from recipes.models import ShortLink
+from . import metrics
+from .lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+links = LRUCache('SHORT_LINK_CACHE_SIZE', 'SHORT_LINK_CACHE_TTL',
+                 size=10000, ttl=300)
+
+
+def encode(number):
+    code = ''
+    while True:
+        number, digit = divmod(number, len(ALPHABET))
+        code = ALPHABET[digit] + code
+        if not number:
+            return code
+
+
+def shared_key(code):
+    return f'short-link:{code}'
+
+
+def link_for(recipe):
+    link, _ = ShortLink.objects.get_or_create(
+        recipe=recipe, defaults={'code': encode(recipe.pk)})
+    return link
+
+
+def resolve(code):
+    """(id ссылки, id рецепта) по коду или None, если ссылки нет."""
+    entry = links.get(code)
+    if entry is None:
+        entry = shared_cache.get(shared_key(code))
+        if entry is not None:
+            links.set(code, entry)
+    metrics.cache_result('short_link', entry is not None)
+    if entry is None:
+        entry = (ShortLink.objects.filter(code=code)
+                 .values_list('pk', 'recipe_id').first())
+        if entry is None:
+            return None
+        # Код ссылки не меняется, а удаление чистит общий кеш сигналом.
+        shared_cache.set(shared_key(code), entry, None)
+        links.set(code, entry)
+    return entry
+
+
+def forget(code):
+    links.delete(code)
+    shared_cache.delete(shared_key(code))
+
+
+class HitBuffer:
+    """Счётчики переходов, которые пишутся в базу пачками."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._flushed_at = time.monotonic()
+
+    def add(self, link_id):
+        with self._lock:
+            self._hits[link_id] += 1
+        interval = getattr(settings, 'SHORT_LINK_FLUSH_INTERVAL', 10)
+        if time.monotonic() - self._flushed_at >= interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._flushed_at = time.monotonic()
+        if not hits:
+            return
+        try:
+            ShortLink.objects.filter(pk__in=hits).update(hits=F('hits') + Case(
+                *(When(pk=pk, then=Value(count))
+                  for pk, count in hits.items()),
+                default=Value(0)))
+        except DatabaseError:
+            logger.exception('Не удалось записать переходы по ссылкам')
+            with self._lock:
+                self._hits.update(hits)
+
+
+hits = HitBuffer()
+atexit.register(hits.flush)
@@ -0,0 +1,75 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from recipes import scores
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShortLink, User)
+from . import cache, short_links, timing
+from .authentication import auth_key
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    cache.bump(cache.RECIPES, cache.recipe_key(instance.pk))
+
+
+# Состав рецепта, исправленный в админке без сохранения самого рецепта.
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    cache.bump(cache.RECIPES, cache.recipe_key(instance.recipe_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    # Смена пароля, деактивация и правка профиля: закешированный
+    # по токену пользователь больше не годится.
+    cache.bump(cache.AUTHORS, auth_key(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    cache.bump(auth_key(instance.user_id))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    cache.bump(cache.INGREDIENTS)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def user_recipes_changed(sender, instance, **kwargs):
+    cache.bump(cache.user_state_key(instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    cache.bump(cache.user_state_key(instance.user_id))
+
+
+@receiver(scores.scores_changed)
+def scores_changed(sender, **kwargs):
+    cache.bump(cache.SCORES)
+
+
+@receiver(post_delete, sender=ShortLink)
+def short_link_removed(sender, instance, **kwargs):
+    short_links.forget(instance.code)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if timing.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timing.record_query)
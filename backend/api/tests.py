@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from datetime import timedelta
+from time import perf_counter
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import authentication, metrics, middleware, short_links, timing
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeListSerializer, RecipeReadSerializer
+from api.views import RecipeViewSet
+from recipes import (counters, ingredient_index, ingredient_sets, scores,
+                     search, shopping_list)
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, RecipeScore, ShoppingCart,
+                            ShoppingListItem, ShortLink, TimelineEntry, User)
+
+REPORT_PATH = os.getenv(
+    'QUERY_BUDGET_REPORT',
+    os.path.join(settings.BASE_DIR, 'query_budget_report.json'))
+SIZES = (1, 10, 100)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@foodgram.ru', username=username,
+        password='Pa55word!', first_name=username, last_name=username)
+
+
+def create_recipes(author, count, ingredients):
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=author, name=f'{author.username} {number}',
+               text='Описание', cooking_time=10, image='recipe.png')
+        for number in range(count))
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+        for recipe in recipes
+        for ingredient in ingredients)
+    counters.change(User, 'recipes_count', [author.id], count)
+    return recipes
+
+
+class ApiTestCase(TestCase):
+    """Кеши не откатываются вместе с базой, поэтому чистим их."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        authentication.tokens.clear()
+        short_links.links.clear()
+
+
+class QueryBudgetMixin:
+    """Замеряет число SQL-запросов и время ответа эндпоинта.
+
+    Результаты всех замеров дописываются в JSON-отчёт (QUERY_BUDGET_REPORT),
+    чтобы прогоны можно было сравнивать между собой.
+    """
+
+    report = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not cls.report:
+            return
+        data = {}
+        if os.path.exists(REPORT_PATH):
+            with open(REPORT_PATH, encoding='utf-8') as report_file:
+                data = json.load(report_file)
+        for endpoint, sizes in cls.report.items():
+            data.setdefault(endpoint, {}).update(sizes)
+        with open(REPORT_PATH, 'w', encoding='utf-8') as report_file:
+            json.dump(data, report_file, ensure_ascii=False, indent=2)
+        cls.report = {}
+
+    def measure(self, endpoint, size, url):
+        with CaptureQueriesContext(connection) as context:
+            start = perf_counter()
+            response = self.client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = perf_counter() - start
+        self.assertEqual(response.status_code, 200, url)
+        queries = len(context.captured_queries)
+        type(self).report.setdefault(endpoint, {})[str(size)] = {
+            'queries': queries,
+            'seconds': round(elapsed, 6),
+        }
+        return queries
+
+    def assertConstantQueries(self, endpoint, urls):
+        # Замеряется установившийся режим: токен клиента уже в кеше.
+        self.client.get('/api/users/me/')
+        counts = {
+            size: self.measure(endpoint, size, url)
+            for size, url in urls.items()}
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'{endpoint}: число запросов растёт вместе с данными {counts}')
+
+
+class RecipeQueryBudgetTest(QueryBudgetMixin, ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = create_user('author')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(3))
+        cls.recipes = create_recipes(cls.author, max(SIZES), ingredients)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        Favorite.objects.bulk_create(
+            Favorite(author=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::2])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(author=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::3])
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_recipe_list_anonymous(self):
+        self.client.credentials()
+        self.assertConstantQueries('recipes-list-anonymous', {
+            size: f'/api/recipes/?limit={size}' for size in SIZES})
+
+    def test_recipe_list_authenticated(self):
+        self.assertConstantQueries('recipes-list', {
+            size: f'/api/recipes/?limit={size}' for size in SIZES})
+
+    def test_recipe_list_filtered(self):
+        self.assertConstantQueries('recipes-list-favorited', {
+            size: f'/api/recipes/?limit={size}&is_favorited=1'
+            for size in SIZES})
+
+    def test_recipe_detail(self):
+        self.assertConstantQueries('recipes-detail', {
+            size: f'/api/recipes/{recipe.id}/'
+            for size, recipe in zip(SIZES, self.recipes)})
+
+    def test_recipe_flags_follow_request_user(self):
+        response = self.client.get('/api/recipes/?limit=100')
+        results = {item['id']: item for item in response.data['results']}
+        for recipe in self.recipes:
+            self.assertEqual(
+                results[recipe.id]['is_favorited'],
+                Favorite.objects.filter(
+                    author=self.user, recipe=recipe).exists())
+        self.client.credentials()
+        response = self.client.get('/api/recipes/?limit=100')
+        self.assertFalse(any(
+            item['is_favorited'] for item in response.data['results']))
+
+
+class ShoppingCartQueryBudgetTest(QueryBudgetMixin, ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(20))
+        recipes = create_recipes(author, max(SIZES), ingredients)
+        cls.tokens = {}
+        for size in SIZES:
+            user = create_user(f'buyer{size}')
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(author=user, recipe=recipe)
+                for recipe in recipes[:size])
+            cls.tokens[size] = Token.objects.create(user=user).key
+        shopping_list.rebuild()
+
+    def test_download_shopping_cart(self):
+        counts = {}
+        for size, key in self.tokens.items():
+            self.client = APIClient()
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+            counts[size] = self.measure(
+                'download-shopping-cart', size,
+                '/api/recipes/download_shopping_cart/')
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_download_formats(self):
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.tokens[10]}')
+        url = '/api/recipes/download_shopping_cart/'
+        response = self.client.get(url, {'format': 'json'})
+        items = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items[0]['amount'], 50)
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            len(b''.join(response.streaming_content).splitlines()), 21)
+        response = self.client.get(url)
+        self.assertIn('Список покупок',
+                      b''.join(response.streaming_content).decode())
+        response = self.client.get(url, {'format': 'xls'})
+        self.assertEqual(response.status_code, 400)
+
+
+class IngredientSearchTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Соль', 'сахар', 'соевый соус', 'молоко'))
+
+    def test_prefix_search_without_queries(self):
+        self.client.get('/api/ingredients/', {'name': 'с'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/', {'name': 'Со'})
+        self.assertEqual(
+            [item['name'] for item in response.data['results']],
+            ['Соль', 'соевый соус'])
+
+    def test_index_invalidated_on_change(self):
+        self.client.get('/api/ingredients/', {'name': 'м'})
+        version = cache.get(ingredient_index.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='мука', measurement_unit='г')
+            self.assertEqual(cache.get(ingredient_index.VERSION_KEY), version)
+        response = self.client.get('/api/ingredients/', {'name': 'м'})
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class CursorPaginationTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipes = create_recipes(author, 25, [ingredient])
+
+    def test_walk_forward_and_back(self):
+        url = '/api/recipes/?limit=10&cursor='
+        seen = []
+        pages = []
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            pages.append([item['id'] for item in response.data['results']])
+            seen.extend(pages[-1])
+            url = response.data['next']
+        self.assertEqual(seen, sorted(
+            (recipe.id for recipe in self.recipes), reverse=True))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in response.data['results']], pages[1])
+
+    def test_page_number_mode_unchanged(self):
+        response = self.client.get('/api/recipes/?limit=10&page=2')
+        self.assertEqual(response.data['count'], 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_cursor_values(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='author'))
+        for position in (['x', 'y'], [None, None], [[1], {}],
+                         ['2026-01-01T00:00:00+00:00', 10 ** 30]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position, 'r': 0}).encode()).decode()
+            for url in ('/api/recipes/', '/api/users/'):
+                response = client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404, (url, position))
+
+    def test_equal_pub_dates(self):
+        Recipe.objects.update(pub_date=self.recipes[0].pub_date)
+        url = '/api/recipes/?limit=7&cursor='
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+
+class RecipeSearchTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        pepper = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        cls.soup, cls.salad, cls.pie = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=name, text=text,
+                   cooking_time=10, image='recipe.png')
+            for name, text in (
+                ('Суп', 'Посолить по вкусу'),
+                ('Салат', 'Суп к нему не подают'),
+                ('Пирог', 'Выпекать час')))
+        IngredientRecipe.objects.bulk_create((
+            IngredientRecipe(recipe=cls.soup, ingredient=salt, amount=5),
+            IngredientRecipe(recipe=cls.pie, ingredient=pepper, amount=1)))
+        search.index_recipes()
+
+    def search(self, term):
+        response = self.client.get('/api/recipes/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_ranked_by_field_weight(self):
+        self.assertEqual(self.search('суп'), [self.soup.id, self.salad.id])
+
+    def test_cursor_keeps_rank_order(self):
+        ids = []
+        url, params = '/api/recipes/', {'search': 'суп', 'cursor': '', 'limit': 1}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, [self.soup.id, self.salad.id])
+
+    def test_cursor_through_tied_ranks(self):
+        porridges = Recipe.objects.bulk_create(
+            Recipe(author=create_user(f'cook{number}'), name='Каша',
+                   text='Сварить', cooking_time=10, image='recipe.png')
+            for number in range(5))
+        search.index_recipes([recipe.id for recipe in porridges])
+        ids = []
+        url, params = '/api/recipes/', {'search': 'каша', 'cursor': '', 'limit': 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, sorted((recipe.id for recipe in porridges),
+                                     reverse=True))
+
+    def test_ingredient_rows_reindexed(self):
+        pepper = Ingredient.objects.get(name='Перец')
+        with self.captureOnCommitCallbacks(execute=True):
+            row = IngredientRecipe.objects.create(
+                recipe=self.salad, ingredient=pepper, amount=1)
+        self.assertEqual(sorted(self.search('перец')),
+                         sorted([self.pie.id, self.salad.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            row.delete()
+        self.assertEqual(self.search('перец'), [self.pie.id])
+
+    def test_ingredients_and_prefixes(self):
+        self.assertEqual(self.search('перец'), [self.pie.id])
+        self.assertEqual(self.search('пир'), [self.pie.id])
+        self.assertEqual(self.search('суп соль'), [self.soup.id])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_index_follows_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name='Борщ', text='Свёкла',
+                cooking_time=60, image='recipe.png')
+        self.assertEqual(self.search('борщ'), [recipe.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Щи'
+            recipe.save()
+        self.assertEqual(self.search('борщ'), [])
+        recipe.delete()
+        self.assertEqual(self.search('щи'), [])
+
+
+class IngredientSetTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.salt, cls.egg, cls.milk, cls.flour = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('соль', 'яйцо', 'молоко', 'мука'))
+        cls.omelette, = create_recipes(
+            create_user('chef'), 1, [cls.salt, cls.egg, cls.milk])
+        cls.eggs, = create_recipes(
+            create_user('cook'), 1, [cls.salt, cls.egg])
+        cls.bread, = create_recipes(
+            create_user('baker'), 1, [cls.flour, cls.salt])
+
+    def match(self, ingredients, mode=None):
+        params = {'ingredients': ','.join(str(item.id) for item in ingredients)}
+        if mode:
+            params['match'] = mode
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def check_modes(self):
+        ingredients = [self.egg, self.milk, self.salt]
+        self.assertEqual(self.match(ingredients), [self.omelette.id])
+        self.assertEqual(self.match(ingredients, 'most'),
+                         [self.omelette.id, self.eggs.id])
+        self.assertEqual(self.match(ingredients, 'any'),
+                         [self.omelette.id, self.eggs.id, self.bread.id])
+        self.assertEqual(self.match([self.flour, self.milk]), [])
+
+    def test_database_postings(self):
+        self.check_modes()
+
+    @override_settings(INGREDIENT_POSTINGS_IN_MEMORY=True)
+    def test_in_memory_postings(self):
+        self.check_modes()
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=self.bread, ingredient=self.egg, amount=1)
+        self.assertEqual(self.match([self.egg, self.flour]), [self.bread.id])
+
+    def test_cursor_keeps_coverage_order(self):
+        ids = []
+        url, params = '/api/recipes/', {
+            'ingredients': f'{self.egg.id},{self.milk.id},{self.salt.id}',
+            'match': 'any', 'cursor': '', 'limit': 1}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(ids, [self.omelette.id, self.eggs.id, self.bread.id])
+
+    def test_version_follows_postings_only(self):
+        cache.set(ingredient_sets.VERSION_KEY, 1, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bread.save(update_fields=['image_variants'])
+            self.bread.save()
+            row = self.bread.recipe_ingredients.first()
+            row.amount = 10
+            row.save(update_fields=['amount'])
+        self.assertEqual(cache.get(ingredient_sets.VERSION_KEY), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            row.delete()
+        self.assertNotEqual(cache.get(ingredient_sets.VERSION_KEY), 1)
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/recipes/', {'ingredients': 'a,b'})
+        self.assertEqual(response.status_code, 400)
+        for value in ('99999999999999999999999', '0', '-1',
+                      ','.join(map(str, range(1, 52)))):
+            response = self.client.get(
+                '/api/recipes/', {'ingredients': value})
+            self.assertEqual(response.status_code, 400, value)
+        response = self.client.get(
+            '/api/recipes/', {'ingredients': '1', 'match': 'some'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncReadTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe, = create_recipes(author, 1, [ingredient])
+        Follow.objects.create(user=cls.user, author=author)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def test_read_routes_are_async(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/',
+                    '/api/users/me/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+        for url in (f'/api/recipes/{self.recipe.id}/favorite/',
+                    '/api/ingredients/', '/api/users/subscriptions/'):
+            self.assertFalse(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_async_client(self):
+        headers = {'AUTHORIZATION': f'Token {self.token.key}'}
+        response = await self.async_client.get('/api/recipes/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.recipe.id)
+        response = await self.async_client.get(
+            '/api/recipes/', headers={**headers, 'IF_NONE_MATCH': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(
+            '/api/ingredients/', {'name': 'с'}, headers=headers)
+        self.assertEqual(response.json()['results'][0]['name'], 'соль')
+        response = await self.async_client.get('/api/users/me/', headers=headers)
+        self.assertEqual(response.json()['username'], 'reader')
+        response = await self.async_client.get(
+            '/api/users/subscriptions/', headers=headers)
+        self.assertEqual(response.json()['results'][0]['username'], 'author')
+
+    async def test_shopping_list_streams_under_asgi(self):
+        await ShoppingCart.objects.acreate(author=self.user, recipe=self.recipe)
+        response = await self.async_client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'json'},
+            headers={'AUTHORIZATION': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response])
+        self.assertEqual(json.loads(content), [
+            {'name': 'соль', 'amount': 5, 'measurement_unit': 'г'}])
+
+    def test_writes_on_async_route(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post('/api/recipes/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CachedTokenAuthenticationTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('reader')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def me_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_token_resolved_once(self):
+        self.assertEqual(self.me_queries() - self.me_queries(), 1)
+
+    def test_cached_user_not_shared(self):
+        auth = authentication.CachedTokenAuthentication()
+        first, _ = auth.authenticate_credentials(self.token.key)
+        first.first_name = 'Изменено'
+        first.is_subscribed = True
+        second, _ = auth.authenticate_credentials(self.token.key)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, self.user.first_name)
+        self.assertFalse(hasattr(second, 'is_subscribed'))
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_logout(self):
+        self.me_queries()
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_set_password(self):
+        cold = self.me_queries()
+        self.me_queries()
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'Pa55word!', 'new_password': 'N3w-pa55word!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.me_queries(), cold)
+
+    def test_deactivation(self):
+        self.me_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+class ServerTimingTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        create_recipes(create_user('author'), 3, [ingredient])
+
+    def header(self, response):
+        metrics = dict(
+            metric.split(';', 1) for metric in
+            response['Server-Timing'].split(', '))
+        self.assertEqual(
+            set(metrics), {'db', 'view', 'serialize', 'render', 'total'})
+        return metrics
+
+    @override_settings(SERVER_TIMING=True)
+    def test_header(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/')
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"',
+                      self.header(response)['db'])
+
+    @override_settings(SERVER_TIMING=True)
+    async def test_header_under_asgi(self):
+        response = await self.async_client.get('/api/recipes/')
+        self.assertRegex(self.header(response)['db'], r'desc="[1-9]\d* queries"')
+
+    def test_header_off_by_default(self):
+        self.assertFalse(settings.SERVER_TIMING)
+        self.assertNotIn('Server-Timing', self.client.get('/api/recipes/'))
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            self.client.get('/api/recipes/')
+        record = json.loads(logs.records[0].args[0])
+        self.assertEqual(record['path'], '/api/recipes/')
+        self.assertEqual(record['serialize_queries'], 0)
+        self.assertGreater(record['queries'], 0)
+
+    def test_repeated_statements_grouped(self):
+        timings = timing.RequestTimings()
+        timings.add_query('SELECT 1 FROM t WHERE id IN (%s, %s)', 0.001)
+        timings.add_query('SELECT 1 FROM t WHERE id IN (%s)', 0.001)
+        timings.add_query('SELECT 2', 0.001)
+        self.assertEqual(timings.top_statements(), [{
+            'sql': 'SELECT 1 FROM t WHERE id IN (...)',
+            'count': 2, 'ms': 2.0}])
+
+
+class MetricsTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = create_user('staff')
+        cls.staff.is_staff = True
+        cls.staff.save()
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        recipe, = create_recipes(create_user('author'), 1, [ingredient])
+        ShoppingCart.objects.create(author=cls.staff, recipe=recipe)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(METRICS_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.directory = directory.name
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return dict(
+            line.rsplit(' ', 1) for line in response.content.decode().splitlines()
+            if not line.startswith('#'))
+
+    def test_staff_only(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+    def test_route_metrics(self):
+        requests = 'foodgram_requests_total{method="GET",route="recipe-list",status="200"}'
+        queries = 'foodgram_request_db_queries_count{route="recipe-list"}'
+        before = self.scrape()
+        self.client.get('/api/recipes/')
+        b''.join(self.client.get(
+            '/api/recipes/download_shopping_cart/').streaming_content)
+        after = self.scrape()
+        self.assertEqual(
+            int(after[requests]) - int(before.get(requests, 0)), 1)
+        self.assertEqual(
+            int(after[queries]) - int(before.get(queries, 0)), 1)
+        self.assertIn(
+            'foodgram_request_duration_seconds_bucket'
+            '{method="GET",route="recipe-list",le="+Inf"}', after)
+        self.assertIn(
+            'foodgram_shopping_list_bytes_count{format="txt"}', after)
+        self.assertIn(
+            'foodgram_cache_requests_total{cache="response",result="miss"}',
+            after)
+
+    def test_processes_are_summed(self):
+        key = 'foodgram_requests_total{method="GET",route="recipe-list",status="200"}'
+        before = int(self.scrape().get(key, 0))
+        with open(os.path.join(self.directory, 'metrics-1.json'), 'w') as file:
+            json.dump({'foodgram_requests_total': {metrics.label_key({
+                'route': 'recipe-list', 'method': 'GET', 'status': '200',
+            }): 5}}, file)
+        self.assertEqual(int(self.scrape()[key]), before + 5)
+
+    def test_files_cleared_on_start(self):
+        self.client.get('/api/recipes/')
+        metrics.registry.flush()
+        filename, = os.listdir(self.directory)
+        self.assertRegex(filename, rf'^metrics-{os.getpid()}-\d+\.json$')
+        metrics.clear()
+        self.assertEqual(os.listdir(self.directory), [])
+
+    async def test_middleware_async_under_asgi(self):
+        async def view(request):
+            return HttpResponse()
+
+        for middleware_class in (middleware.ServerTimingMiddleware,
+                                 middleware.MetricsMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware_class(view)))
+            self.assertFalse(iscoroutinefunction(
+                middleware_class(lambda request: HttpResponse())))
+        key = 'foodgram_requests_total{method="GET",route="recipe-list",status="200"}'
+        before = int(self.scrape().get(key, 0))
+        await self.async_client.get('/api/recipes/')
+        self.assertEqual(int(self.scrape()[key]), before + 1)
+
+
+class FastSerializationTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('автор')
+        author.avatar = 'аватар.png'
+        author.avatar_variants = {'avatar': {'webp': 'variants/a.webp'}}
+        author.save()
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in (('соль', 'г'), ('яйца', 'шт"')))
+        cls.recipes = create_recipes(author, 3, ingredients)
+        cls.recipes[0].text = 'Строка\u2028с «разделителем»'
+        cls.recipes[0].image_variants = {
+            'card': {'webp': 'variants/c.webp', 'jpeg': 'variants/c.jpeg'}}
+        cls.recipes[0].save()
+        Favorite.objects.create(author=cls.user, recipe=cls.recipes[1])
+        Follow.objects.create(user=cls.user, author=author)
+
+    def render(self, user, serializer_class, renderer):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        view = RecipeViewSet(request=request, action='list', format_kwarg=None)
+        serializer = serializer_class(
+            view.get_queryset(), many=True, context={'request': request})
+        return renderer.render(serializer.data)
+
+    def test_golden_output(self):
+        for user in (self.user, AnonymousUser()):
+            expected = self.render(user, RecipeListSerializer, JSONRenderer())
+            self.assertEqual(
+                self.render(user, RecipeReadSerializer, FastJSONRenderer()),
+                expected)
+        self.assertIn(b'\\u2028', expected)
+
+    def test_renderer_matches_drf(self):
+        data = {'date': Recipe.objects.first().pub_date, 'decimal': Decimal('1.50'),
+                1: ['«', '\u2029'], 'nested': {'none': None, 'float': 0.1}}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'))
+
+    def test_endpoint_output(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/')
+        self.assertEqual(
+            json.loads(self.render(self.user, RecipeListSerializer,
+                                   JSONRenderer())),
+            response.json()['results'])
+
+
+class SparseFieldsTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        create_recipes(author, 3, [ingredient])
+        Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        return response.json(), len(context.captured_queries), sql
+
+    def test_recipe_fields(self):
+        full, full_queries, _ = self.get('/api/recipes/')
+        data, queries, sql = self.get('/api/recipes/?fields=id,name')
+        self.assertEqual(list(data['results'][0]), ['id', 'name'])
+        self.assertLess(queries, full_queries)
+        for name in ('recipes_ingredientrecipe', 'recipes_favorite',
+                     '"text"', 'users_user'):
+            self.assertNotIn(name, sql)
+        data, _, sql = self.get('/api/recipes/?omit=text,ingredients,author')
+        self.assertEqual(
+            list(data['results'][0]),
+            [name for name in full['results'][0]
+             if name not in ('text', 'ingredients', 'author')])
+        self.assertIn('recipes_favorite', sql)
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/recipes/?fields=id,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+
+    def test_user_fields(self):
+        data, _, _ = self.get('/api/users/me/?fields=id,email')
+        self.assertEqual(data, {'id': self.user.id, 'email': self.user.email})
+        data, _, sql = self.get('/api/users/subscriptions/?omit=recipes')
+        self.assertNotIn('recipes', data['results'][0])
+        self.assertNotIn('recipes_recipe', sql)
+        data, _, _ = self.get('/api/users/?fields=username,is_subscribed')
+        self.assertIn({'username': 'author', 'is_subscribed': True},
+                      data['results'])
+
+
+class ConditionalGetTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe, = create_recipes(author, 1, [ingredient])
+
+    def test_not_modified_without_queries(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], self.recipe.id)
+
+    def test_padded_id_uses_recipe_version(self):
+        url = f'/api/recipes/00{self.recipe.id}/'
+        self.assertEqual(self.client.get(url).data['name'], self.recipe.name)
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assertEqual(self.client.get(url).data['name'], 'Новое название')
+        self.assertEqual(self.client.get('/api/recipes/abc/').status_code, 404)
+
+    async def test_padded_id_under_asgi(self):
+        response = await self.async_client.get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(
+            f'/api/recipes/00{self.recipe.id}/')
+        self.assertEqual(response.json()['id'], self.recipe.id)
+
+    def test_writes_change_etag(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/recipes/'
+        etag = client.get(url)['ETag']
+        self.assertEqual(client.get(url)['ETag'], etag)
+        client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        self.assertNotEqual(
+            self.client.get(url)['ETag'], response['ETag'])
+
+
+class BatchListsTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipes = create_recipes(author, 30, [ingredient])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, ids):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return ({item['id']: item['status']
+                 for item in response.json()['results']},
+                len(context.captured_queries))
+
+    def test_shopping_cart_batch(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        first, second, *rest = [recipe.id for recipe in self.recipes]
+        self.client.post(f'/api/recipes/{first}/shopping_cart/')
+        results, _ = self.send('post', url, [first, second, second, 999])
+        self.assertEqual(
+            results, {first: 'exists', second: 'added', 999: 'not_found'})
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount, 10)
+        self.assertEqual(
+            Recipe.objects.get(pk=second).shopping_cart_count, 1)
+        results, _ = self.send('delete', url, [first, rest[0]])
+        self.assertEqual(results, {first: 'removed', rest[0]: 'missing'})
+        self.assertEqual(
+            list(ShoppingCart.objects.filter(author=self.user)
+                 .values_list('recipe_id', flat=True)), [second])
+        self.assertEqual(Recipe.objects.get(pk=first).shopping_cart_count, 0)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount, 5)
+
+    def test_constant_queries(self):
+        url = '/api/recipes/favorite/batch/'
+        ids = [recipe.id for recipe in self.recipes]
+        _, few = self.send('post', url, ids[:3])
+        _, many = self.send('post', url, ids[3:])
+        self.assertEqual(few, many)
+        self.assertEqual(Favorite.objects.filter(author=self.user).count(), 30)
+        _, few = self.send('delete', url, ids[:3])
+        _, many = self.send('delete', url, ids[3:])
+        self.assertEqual(few, many)
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(
+            Recipe.objects.filter(favorites_count__gt=0).exists())
+
+    def test_changes_etag(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.send('post', '/api/recipes/favorite/batch/',
+                  [self.recipes[0].id])
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_payload(self):
+        url = '/api/recipes/favorite/batch/'
+        for data in ({}, {'ids': []}, {'ids': ['x']},
+                     {'ids': list(range(1, 200))}):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(
+            APIClient().post(url, {'ids': [1]}, format='json').status_code,
+            401)
+
+
+class ToggleTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.other = create_user('other')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe, = create_recipes(author, 1, [ingredient])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_response_contract(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.data, {'id': self.recipe.id, 'name': self.recipe.name,
+                            'image': '/media/recipe.png', 'coocking_time': 10})
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(
+            self.client.post('/api/recipes/999/favorite/').status_code, 404)
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).favorites_count, 0)
+
+    def test_cart_delete_with_other_carts(self):
+        ShoppingCart.objects.create(author=self.other, recipe=self.recipe)
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        deletes = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('DELETE')
+                   and 'recipes_shoppingcart' in query['sql']]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(
+            list(ShoppingCart.objects.values_list('author', flat=True)),
+            [self.other.id])
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).shopping_cart_count, 1)
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+        self.assertTrue(ShoppingListItem.objects.filter(user=self.other))
+
+
+class ConcurrentToggleTest(TransactionTestCase):
+    """Параллельные клики по одной кнопке не дают 500 и двойного счёта."""
+
+    clicks = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('buyer')
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        self.recipe, = create_recipes(author, 1, [ingredient])
+
+    def click(self, method, url, data=None):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            response = getattr(client, method)(url, data, format='json')
+            if data is None:
+                return response.status_code
+            return response.json()['results'][0]['status']
+        finally:
+            connections.close_all()
+
+    def parallel(self, method, url, data=None):
+        with ThreadPoolExecutor(max_workers=self.clicks) as pool:
+            return sorted(pool.map(
+                lambda _: self.click(method, url, data), range(self.clicks)))
+
+    def test_parallel_clicks(self):
+        url = f'/api/recipes/{self.recipe.id}/shopping_cart/'
+        self.assertEqual(self.parallel('post', url),
+                         [201] + [400] * (self.clicks - 1))
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).shopping_cart_count, 1)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount, 5)
+        self.assertEqual(self.parallel('delete', url),
+                         [204] + [404] * (self.clicks - 1))
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).shopping_cart_count, 0)
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+
+    def test_parallel_recipes_with_shared_ingredient(self):
+        recipes = create_recipes(
+            create_user('cook'), self.clicks,
+            list(self.recipe.ingredients.all()))
+        with ThreadPoolExecutor(max_workers=self.clicks) as pool:
+            codes = list(pool.map(
+                lambda recipe: self.click(
+                    'post', f'/api/recipes/{recipe.id}/shopping_cart/'),
+                recipes))
+        self.assertEqual(codes, [201] * self.clicks)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount,
+            5 * self.clicks)
+
+    def test_parallel_batches(self):
+        url = '/api/recipes/shopping_cart/batch/'
+        data = {'ids': [self.recipe.id]}
+        self.assertEqual(self.parallel('post', url, data),
+                         ['added'] + ['exists'] * (self.clicks - 1))
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).shopping_cart_count, 1)
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).total_amount, 5)
+        self.assertEqual(self.parallel('delete', url, data),
+                         ['missing'] * (self.clicks - 1) + ['removed'])
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).shopping_cart_count, 0)
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+
+
+@override_settings(SHORT_LINK_FLUSH_INTERVAL=3600)
+class ShortLinkTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe, = create_recipes(author, 1, [ingredient])
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(short_links.hits.flush)
+
+    def test_get_link(self):
+        url = f'/api/recipes/{self.recipe.id}/get-link/'
+        link = self.client.get(url).json()['short-link']
+        self.assertEqual(
+            link, f'http://testserver/s/{short_links.encode(self.recipe.id)}')
+        self.assertEqual(self.client.get(url).json()['short-link'], link)
+        self.assertEqual(ShortLink.objects.count(), 1)
+        self.assertEqual(self.client.get('/api/recipes/999/get-link/')
+                         .status_code, 404)
+
+    def test_encode(self):
+        self.assertEqual(short_links.encode(0), '0')
+        self.assertEqual(short_links.encode(61), 'Z')
+        self.assertEqual(short_links.encode(62), '10')
+
+    def test_redirect_from_cache(self):
+        code = short_links.link_for(self.recipe).code
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/s/{code}')
+        self.assertRedirects(response, f'/recipes/{self.recipe.id}',
+                             fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            self.client.get(f'/s/{code}')
+        # Другой воркер: своего LRU нет, но есть общий кеш.
+        short_links.links.clear()
+        with self.assertNumQueries(0):
+            self.client.get(f'/s/{code}')
+        self.assertEqual(self.client.get('/s/nope').status_code, 404)
+
+    def test_buffered_hits(self):
+        code = short_links.link_for(self.recipe).code
+        for _ in range(3):
+            self.client.get(f'/s/{code}')
+        self.assertEqual(ShortLink.objects.get(code=code).hits, 0)
+        with self.assertNumQueries(1):
+            short_links.hits.flush()
+        self.assertEqual(ShortLink.objects.get(code=code).hits, 3)
+
+    def test_deleted_recipe(self):
+        code = short_links.link_for(self.recipe).code
+        self.client.get(f'/s/{code}')
+        short_links.hits.flush()
+        self.recipe.delete()
+        self.assertEqual(self.client.get(f'/s/{code}').status_code, 404)
+
+
+class RankingTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.old, cls.new, cls.quiet = create_recipes(author, 3, [ingredient])
+        cls.users = [create_user(f'fan{number}') for number in range(5)]
+        month_ago = timezone.now() - timedelta(days=30)
+        for user in cls.users:
+            Favorite.objects.create(author=user, recipe=cls.old,
+                                    created=month_ago)
+        for user in cls.users[:2]:
+            ShoppingCart.objects.create(author=user, recipe=cls.new)
+        scores.rebuild()
+
+    def ids(self, ordering, **params):
+        response = self.client.get(
+            '/api/recipes/', {'ordering': ordering, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_orderings(self):
+        self.assertEqual(self.ids('popular'),
+                         [self.old.id, self.new.id, self.quiet.id])
+        self.assertEqual(self.ids('trending'),
+                         [self.new.id, self.old.id, self.quiet.id])
+        self.assertEqual(
+            self.client.get('/api/recipes/?ordering=name').status_code, 400)
+
+    def test_bump_invalidates_list(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        etag = self.client.get('/api/recipes/?ordering=trending')['ETag']
+        client.post('/api/recipes/shopping_cart/batch/',
+                    {'ids': [self.quiet.id]}, format='json')
+        for user in self.users[1:3]:
+            Favorite.objects.create(author=user, recipe=self.quiet)
+        response = self.client.get('/api/recipes/?ordering=trending',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.quiet.id)
+
+    def test_cursor(self):
+        first = self.client.get(
+            '/api/recipes/?ordering=trending&cursor=&limit=2').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in first['results'] + second['results']],
+            [self.new.id, self.old.id, self.quiet.id])
+
+    def test_far_future_events(self):
+        moment = scores.EPOCH + timedelta(days=365 * 100)
+        scores.bump([self.quiet.id], moment)
+        scores.bump([self.quiet.id], moment)
+        weight = scores.weights(moment)['trending']
+        self.assertAlmostEqual(
+            RecipeScore.objects.get(recipe=self.quiet).trending,
+            scores.log_add(scores.log_add(0.0, weight), weight))
+        self.assertEqual(self.ids('trending')[0], self.quiet.id)
+
+    def test_rebuild_drops_removed(self):
+        Favorite.objects.filter(recipe=self.old).delete()
+        call_command('rebuild_recipe_scores', stdout=StringIO())
+        self.assertEqual(RecipeScore.objects.get(recipe=self.old).popular, 0)
+        self.assertEqual(self.ids('popular')[0], self.new.id)
+
+
+class FeedTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.other = create_user('other')
+        cls.author = create_user('author')
+        cls.stranger = create_user('stranger')
+        for user in (cls.reader, cls.other):
+            Follow.objects.create(user=user, author=cls.author)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [Recipe.objects.create(
+                author=author, name=f'{author.username} {number}',
+                text='Описание', cooking_time=10, image='recipe.png')
+                for number in range(count)]
+
+    def feed(self, url='/api/recipes/feed/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_fan_out_on_write(self):
+        recipes = self.publish(self.author, 3)
+        self.publish(self.stranger, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.other).count(), 3)
+        data = self.feed()
+        self.assertIsNone(data['count'])
+        self.assertEqual([recipe['id'] for recipe in data['results']],
+                         [recipe.id for recipe in reversed(recipes)])
+
+    def test_cursor_pages_cost_the_same(self):
+        recipes = self.publish(self.author, 9)
+        ids, counts = [], []
+        url = '/api/recipes/feed/?limit=3'
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                data = self.feed(url)
+            counts.append(len(context.captured_queries))
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_follow_and_unfollow(self):
+        self.publish(self.stranger, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.reader, author=self.stranger)
+        self.assertEqual(len(self.feed()['results']), 2)
+        Follow.objects.filter(user=self.reader, author=self.stranger).delete()
+        self.assertEqual(self.feed()['results'], [])
+
+    @override_settings(FEED_FAN_OUT_MAX_FOLLOWERS=1)
+    def test_popular_author_fan_out_on_read(self):
+        recipes = self.publish(self.author, 2)
+        self.assertFalse(TimelineEntry.objects.exists())
+        own = self.publish(self.stranger, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.reader, author=self.stranger)
+        data = self.feed('/api/recipes/feed/?limit=2')
+        ids = [recipe['id'] for recipe in data['results']]
+        ids += [recipe['id'] for recipe in self.feed(data['next'])['results']]
+        self.assertEqual(ids, [own[0].id, recipes[1].id, recipes[0].id])
+
+    def test_rebuild(self):
+        self.publish(self.author, 2)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', '--user', str(self.reader.id),
+                     stdout=StringIO())
+        self.assertEqual(len(self.feed()['results']), 2)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.other))
+
+    @override_settings(FEED_BACKFILL_SIZE=1)
+    def test_rebuild_restores_full_history(self):
+        self.publish(self.stranger, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.reader, author=self.stranger)
+        self.assertEqual(len(self.feed()['results']), 1)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(len(self.feed()['results']), 3)
+
+    def test_anonymous(self):
+        self.assertEqual(
+            APIClient().get('/api/recipes/feed/').status_code, 401)
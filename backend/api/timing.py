@@ -0,0 +1,101 @@
+"""Замеры времени обработки запроса для заголовка Server-Timing.
+
+Middleware (api.middleware.ServerTimingMiddleware) заводит на запрос
+объект RequestTimings в contextvar, а отдельные части приложения
+дописывают в него свои замеры: обёртка курсора — SQL-запросы, миксин
+сериализаторов — сериализацию, рендерер — сборку JSON. contextvar
+переносится asgiref между потоками, поэтому замеры собираются и для
+асинхронных вьюх.
+"""
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current = ContextVar('request_timings', default=None)
+
+PLACEHOLDERS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.serialize_queries = 0
+        self.statements = defaultdict(lambda: [0, 0.0])
+        self.serializing = False
+        self.view_started = None
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.durations['db'] += seconds
+        if self.serializing:
+            self.serialize_queries += 1
+        # IN (%s, %s, ...) разной длины — один и тот же запрос.
+        statement = self.statements[PLACEHOLDERS.sub('(...)', sql)]
+        statement[0] += 1
+        statement[1] += seconds
+
+    def top_statements(self, limit=5):
+        repeated = sorted(self.statements.items(),
+                          key=lambda item: (-item[1][0], -item[1][1]))
+        return [{'sql': sql, 'count': count, 'ms': round(seconds * 1000, 2)}
+                for sql, (count, seconds) in repeated[:limit] if count > 1]
+
+
+@contextmanager
+def measure(name):
+    timings = current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка курсора (connection.execute_wrappers) для текущего запроса."""
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - started)
+
+
+@contextmanager
+def serializing():
+    """Считает время внешнего сериализатора, вложенные не учитываются."""
+    timings = current.get()
+    if timings is None or timings.serializing:
+        yield
+        return
+    timings.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serializing = False
+        timings.add('serialize', time.perf_counter() - started)
+
+
+class TimedSerializerMixin:
+    """Считает время to_representation сериализатора.
+
+    Запросы к базе, сделанные во время сериализации, считаются отдельно:
+    их рост вместе с размером страницы — признак N+1.
+    """
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
@@ -1,22 +1,36 @@
+from functools import partial
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import mixins
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.generics import ListAPIView
+from rest_framework.views import APIView
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
-from recipes.models import (Recipe, Ingredient, IngredientRecipe, Favorite, ShoppingCart, User)
-from .serializers import (RecipeListSerializer, IngredientSerializer, FavoriteSerializer,
-                             ShoppingCartSerializer, RecipeWriteSerializer)
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.views import View
+from recipes import scores, timeline, user_lists
+from recipes.models import (Recipe, Ingredient, Favorite, ShoppingCart, ShoppingListItem,
+                            Follow, User)
+from .serializers import (RecipeReadSerializer, IngredientSerializer, FavoriteSerializer,
+                             ShoppingCartSerializer, RecipeWriteSerializer,
+                             RecipeBatchSerializer)
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from . import cache, metrics, short_links
+from .async_views import AsyncReadMixin
+from .cache import VersionedCacheMixin
+from .fieldsets import SparseFieldsViewMixin
 from .permissions import IsOwnerOrAdminOrReadOnly
 from .filters import IngredientSearchFilter, RecipeFilter
 from .paginations import ApiPagination
-from datetime import date
+from .shopping_list import (FORMATS as SHOPPING_LIST_FORMATS,
+                            ShoppingListContentNegotiation,
+                            shopping_list_response)
 
 
 
@@ -42,83 +56,200 @@ class IngredientListView(ListAPIView):
         return self.queryset
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AsyncReadMixin, VersionedCacheMixin, SparseFieldsViewMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsOwnerOrAdminOrReadOnly, )
     filter_backends = (DjangoFilterBackend, )
     pagination_class = ApiPagination
     filterset_class = RecipeFilter
+    async_actions = ('list', 'retrieve')
+    sparse_actions = ('list', 'retrieve', 'feed')
+    cursor_actions = ('feed',)
+
+    def ranking(self):
+        ranking = self.request.query_params.get('ordering')
+        return ranking if ranking in scores.RANKINGS else None
+
+    @property
+    def cursor_ordering(self):
+        if self.action == 'feed':
+            return ('-feed_date', '-id')
+        return ('-pub_date', '-id')
+
+    def list_keys(self):
+        keys = (cache.RECIPES, cache.AUTHORS, cache.INGREDIENTS)
+        return (*keys, cache.SCORES) if self.ranking() else keys
+
+    def retrieve_keys(self):
+        # /api/recipes/007/ должен зависеть от той же версии, что и /7/.
+        try:
+            pk = int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+        return (cache.recipe_key(pk), cache.AUTHORS, cache.INGREDIENTS)
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Recipe.objects.all()
+        # Без ?fields=/?omit= нужно всё; иначе только то, что отдаём.
+        if self.wants('ingredients'):
+            queryset = queryset.prefetch_related(
+                'recipe_ingredients__ingredient')
+        deferred = [name for name in ('text', 'image_variants')
+                    if not self.wants(name)]
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        relations = {'is_favorited': Favorite,
+                     'is_in_shopping_cart': ShoppingCart}
+        if user.is_anonymous:
+            if self.wants('author'):
+                queryset = queryset.select_related('author')
+            return queryset.annotate(**{
+                name: Value(False) for name in relations if self.wants(name)})
+        if self.wants('author'):
+            queryset = queryset.prefetch_related(
+                Prefetch('author', queryset=User.objects.annotate(
+                    is_subscribed=Exists(Follow.objects.filter(
+                        user=user, author=OuterRef('pk'))))))
+        return queryset.annotate(**{
+            name: Exists(model.objects.filter(
+                author=user, recipe=OuterRef('pk')))
+            for name, model in relations.items() if self.wants(name)})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.list_keys(),
+            partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.retrieve_keys(),
+            partial(super().retrieve, request, *args, **kwargs))
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(
+            request, self.list_keys(),
+            sync_to_async(partial(super().list, request, *args, **kwargs)))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(
+            request, self.retrieve_keys(),
+            sync_to_async(partial(super().retrieve, request, *args, **kwargs)))
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
-            return RecipeListSerializer
+            return RecipeReadSerializer
         return RecipeWriteSerializer
 
-    @action(detail=True,
-            methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
-    def favorite(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
+    def toggle(self, request, model, serializer_class, removed):
+        user = request.user
         if request.method == 'POST':
-            if Favorite.objects.filter(author=user, recipe=recipe).exists():
+            recipe = get_object_or_404(
+                Recipe.objects.only('name', 'image', 'cooking_time'),
+                id=self.kwargs.get('pk'))
+            instance = user_lists.add_one(model, user, recipe)
+            if instance is None:
                 return Response({'errors': 'Рецепт уже добавлен!'}, status=status.HTTP_400_BAD_REQUEST)
-            serializer = FavoriteSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        if not Favorite.objects.filter(author=user, recipe=recipe).exists():
+            return Response(serializer_class(instance).data, status=status.HTTP_201_CREATED)
+        if not user_lists.remove_one(model, user, self.kwargs.get('pk')):
             return Response({'errors': 'Объект не найден'}, status=status.HTTP_404_NOT_FOUND)
-        Favorite.objects.get(author=user, recipe=recipe).delete()
-        return Response({'message': 'Рецепт успешно удалён из избранного'}, status=status.HTTP_200_OK)
+        cache.bump(cache.user_state_key(user.pk))
+        return removed
 
+    @action(detail=True,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def favorite(self, request, *args, **kwargs):
+        return self.toggle(request, Favorite, FavoriteSerializer, Response(
+            {'message': 'Рецепт успешно удалён из избранного'}, status=status.HTTP_200_OK))
 
     @action(detail=True, methods=['post', 'delete'], permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
-        if request.method == 'POST':
-            if ShoppingCart.objects.filter(author=user, recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже добавлен!'}, status=status.HTTP_400_BAD_REQUEST)
-            serializer = ShoppingCartSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        if not ShoppingCart.objects.filter(author=user, recipe=recipe).exists():
-            return Response({'errors': 'Объект не найден'}, status=status.HTTP_404_NOT_FOUND)
-        ShoppingCart.objects.get(recipe=recipe).delete()
-        return Response('Рецепт успешно удалён из списка покупок.', status=status.HTTP_204_NO_CONTENT)
+        return self.toggle(request, ShoppingCart, ShoppingCartSerializer, Response(
+            'Рецепт успешно удалён из списка покупок.', status=status.HTTP_204_NO_CONTENT))
+
+    def batch_response(self, request, model):
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = (user_lists.add if request.method == 'POST'
+                  else user_lists.remove)
+        results = change(model, request.user, serializer.validated_data['ids'])
+        if {user_lists.ADDED, user_lists.REMOVED} & set(results.values()):
+            cache.bump(cache.user_state_key(request.user.pk))
+        return Response(
+            {'results': [{'id': pk, 'status': result}
+                         for pk, result in results.items()]},
+            status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated], url_path='favorite/batch')
+    def favorite_batch(self, request):
+        return self.batch_response(request, Favorite)
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        return self.batch_response(request, ShoppingCart)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        queryset = timeline.feed(self.get_queryset(), request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'], permission_classes=[AllowAny], url_path='get-link')
     def get_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        url = request.build_absolute_uri(f'/api/recipes/{recipe.pk}/')
-        return Response({'url': url}, status=status.HTTP_200_OK)
+        recipe = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        link = short_links.link_for(recipe)
+        url = request.build_absolute_uri(f'/s/{link.code}')
+        return Response({'short-link': url}, status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+            content_negotiation_class=ShoppingListContentNegotiation)
     def download_shopping_cart(self, request):
-        user = request.user
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Поддерживаемые форматы: '
+                           f'{", ".join(SHOPPING_LIST_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
         ingredients = (
-            IngredientRecipe.objects
-            .filter(recipe__shopping_cart__author=user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .values('ingredient__name', 'ingredient__measurement_unit',
+                    'total_amount')
             .order_by('ingredient__name')
+            .iterator(chunk_size=500)
         )
+        return shopping_list_response(
+            ingredients, export_format,
+            asynchronous=isinstance(request._request, ASGIRequest))
 
-        today = date.today().strftime("%d-%m-%Y")
-        shopping_list = f'{today}\nСписок покупок\n\n'
 
-        for item in ingredients:
-            shopping_list += (
-                f'{item["ingredient__name"]}: {item["total_amount"]}{item["ingredient__measurement_unit"]}\n'
-            )
-        shopping_list += '\n\nFoodgram.2025'
+class MetricsView(APIView):
+    """Метрики всех воркеров в текстовом формате Prometheus.
 
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = (
-            'attachment; filename="shop_list.txt"'
-        )
-        return response
+    Nginx наружу /metrics не проксирует: Prometheus забирает их напрямую
+    с backend:8000 с токеном сотрудника.
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ShortLinkView(View):
+    """Переход по короткой ссылке на страницу рецепта во фронтенде."""
+
+    def get(self, request, code):
+        entry = short_links.resolve(code)
+        if entry is None:
+            raise Http404
+        link_id, recipe_id = entry
+        short_links.hits.add(link_id)
+        return HttpResponseRedirect(f'/recipes/{recipe_id}')
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -98,6 +102,86 @@ DATABASES = {
     }
 }
 
+# Версии данных для кеша ответов и индексов должны быть общими для всех
+# воркеров gunicorn, поэтому по умолчанию используется файловый кеш.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Заголовок Server-Timing и лог запросов медленнее SLOW_REQUEST_MS.
+# Заголовок раскрывает устройство запросов, поэтому по умолчанию он есть
+# только в режиме отладки.
+SERVER_TIMING = os.getenv('SERVER_TIMING', str(DEBUG)) == 'True'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
+# Метрики Prometheus: файлы воркеров складываются в /metrics.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+
+# Кеш «токен → пользователь» для CachedTokenAuthentication.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', 'False') == 'True'
+
+# Подбор рецептов по ингредиентам: списки рецептов в памяти воркера.
+INGREDIENT_POSTINGS_IN_MEMORY = (
+    os.getenv('INGREDIENT_POSTINGS_IN_MEMORY', 'False') == 'True')
+INGREDIENT_POSTINGS_MAX_IDS = int(os.getenv('INGREDIENT_POSTINGS_MAX_IDS', 1000))
+# Сколько ингредиентов можно передать в ?ingredients= за раз.
+INGREDIENT_FILTER_MAX_IDS = int(os.getenv('INGREDIENT_FILTER_MAX_IDS', 50))
+
+# Короткие ссылки: LRU процесса перед общим кешем и запись переходов
+# в базу раз в SHORT_LINK_FLUSH_INTERVAL секунд.
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_CACHE_TTL = int(os.getenv('SHORT_LINK_CACHE_TTL', 300))
+SHORT_LINK_FLUSH_INTERVAL = int(os.getenv('SHORT_LINK_FLUSH_INTERVAL', 10))
+
+# Рейтинги рецептов: за сколько дней вклад добавления в избранное или
+# корзину уменьшается вдвое.
+RECIPE_POPULAR_HALF_LIFE_DAYS = float(os.getenv('RECIPE_POPULAR_HALF_LIFE_DAYS', 30))
+RECIPE_TRENDING_HALF_LIFE_DAYS = float(os.getenv('RECIPE_TRENDING_HALF_LIFE_DAYS', 3))
+
+# Лента подписок: рецепты авторов с большим числом подписчиков не
+# раскладываются по лентам, а подмешиваются при чтении.
+FEED_FAN_OUT_MAX_FOLLOWERS = int(os.getenv('FEED_FAN_OUT_MAX_FOLLOWERS', 1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+# Уменьшенные копии картинок нарезаются пулом потоков после ответа.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_PROCESSING_SYNC = False
+
+# Наибольшее число рецептов в одном пакетном запросе к избранному и корзине.
+RECIPE_BATCH_SIZE = int(os.getenv('RECIPE_BATCH_SIZE', 100))
+
+# Тесты и бенчмарки запросов гоняются на SQLite без внешних сервисов.
+if 'test' in sys.argv:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        # Файл, а не общая память: параллельные запросы в тестах ждут
+        # блокировку записи, а не падают с «database table is locked».
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'NAME': os.path.join(
+            tempfile.gettempdir(), 'foodgram-test.sqlite3')},
+    }
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    IMAGE_PROCESSING_SYNC = True
+    METRICS_DIR = os.path.join(tempfile.gettempdir(), 'foodgram-metrics-test')
+
 # DATABASES = {
 #     'default': {
 #         'ENGINE': 'django.db.backends.postgresql',
@@ -130,7 +214,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -139,7 +223,7 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10000,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'api.renderers.FastJSONRenderer',
     ),
 }
 
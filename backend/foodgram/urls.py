@@ -3,9 +3,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from api.views import MetricsView, ShortLinkView
+
 urlpatterns = [
     path('api/', include('api.urls')),
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('s/<str:code>', ShortLinkView.as_view(), name='short-link'),
 ]
 
 if settings.DEBUG:
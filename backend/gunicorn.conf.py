@@ -0,0 +1,9 @@
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска, иначе /metrics суммирует их вечно.
+    from api import metrics
+    metrics.clear()
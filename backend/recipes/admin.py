@@ -1,6 +1,11 @@
+from functools import partial
+
 from django.contrib import admin
+from django.db import transaction
+
+from . import search, shopping_list
 from .models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                     Recipe, ShoppingCart,)
+                     Recipe, ShoppingCart, ShortLink)
 
 
 class IngredientsInline(admin.TabularInline):
@@ -31,6 +36,27 @@ class IngredientRecipeAdmin(admin.ModelAdmin):
     list_filter = ('recipe', 'ingredient')
     search_fields = ('name',)
 
+    # Сводный список покупок ведётся не сигналами, а явными дельтами.
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(form.initial.get('recipe'))
+        with shopping_list.tracking(recipe_ids - {None}):
+            super().save_model(request, obj, form, change)
+            # Строку могли перенести в другой рецепт: старый тоже
+            # переиндексируем.
+            transaction.on_commit(
+                partial(search.index_recipes, recipe_ids - {None}))
+
+    def delete_model(self, request, obj):
+        with shopping_list.tracking([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with shopping_list.tracking(
+                queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'name', 'pub_date', 'in_favorite', )
@@ -40,11 +66,21 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = 'empty'
     inlines = [IngredientsInline]
 
+    def save_related(self, request, form, formsets, change):
+        with shopping_list.tracking([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
     def in_favorite(self, obj):
-        return obj.favorite.all().count()
+        return obj.favorites_count
     in_favorite.short_description = 'Рецепты в избранном'
 
 
+class ShortLinkAdmin(admin.ModelAdmin):
+    list_display = ('code', 'recipe', 'hits')
+    search_fields = ('code',)
+    readonly_fields = ('hits',)
+
+
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
     list_filter = ('name',)
@@ -57,3 +93,4 @@ admin.site.register(IngredientRecipe, IngredientRecipeAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShortLink, ShortLinkAdmin)
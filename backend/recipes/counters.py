@@ -0,0 +1,50 @@
+"""Денормализованные счётчики избранного, корзин, рецептов и подписчиков.
+
+Счётчики меняются атомарными UPDATE ... SET x = x ± n (см. signals.py),
+поэтому параллельные запросы не теряют изменений. recompute() заново
+пересчитывает все счётчики по таблицам связей.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+# (модель счётчика, поле, модель связи, поле связи на модель счётчика)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change(model, field, ids, delta):
+    if not ids:
+        return
+    model.objects.filter(pk__in=ids).update(
+        **{field: Greatest(F(field) + delta, Value(0))})
+
+
+@transaction.atomic
+def recompute():
+    for model, field, relation, lookup in COUNTERS:
+        model.objects.update(**{field: Coalesce(Subquery(
+            relation.objects
+            .filter(**{lookup: OuterRef('pk')})
+            .order_by()
+            .values(lookup)
+            .annotate(total=Count('pk'))
+            .values('total')), 0)})
+
+
+def mismatches():
+    result = []
+    for model, field, relation, lookup in COUNTERS:
+        actual = dict(
+            relation.objects.order_by().values(lookup)
+            .annotate(total=Count('pk')).values_list(lookup, 'total'))
+        for pk, stored in model.objects.values_list('pk', field):
+            if stored != actual.get(pk, 0):
+                result.append((model._meta.label, pk, field, stored, actual.get(pk, 0)))
+    return result
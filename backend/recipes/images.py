@@ -0,0 +1,171 @@
+"""Фоновая нарезка уменьшенных копий картинок рецептов и аватаров.
+
+Запрос только декодирует Base64, проверяет формат по сигнатуре и
+резервирует имя файла. Оригинал в хранилище и копии нужных размеров в WebP
+и JPEG записывает пул потоков процесса после коммита транзакции, поэтому
+файл появляется по своему адресу чуть позже ответа (а при падении процесса
+до записи теряется). Пути к копиям записываются в JSON-поле модели
+(image_variants / avatar_variants) и отдаются сериализаторами как словарь
+{размер: {формат: url}}. Файлы заменённых и удалённых картинок убирают
+сигналы recipes.signals.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from drf_extra_fields import fields as extra_fields
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    'recipe': {'card': (480, 480), 'detail': (1200, 1200)},
+    'avatar': {'avatar': (160, 160)},
+}
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+    thread_name_prefix='image-variants')
+
+
+class Base64ImageField(extra_fields.Base64ImageField):
+    """Base64-картинка без полного разбора PIL в запросе.
+
+    Формат определяется по сигнатуре, а саму картинку открывает уже
+    фоновая нарезка копий.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('_DjangoImageField', forms.FileField)
+        super().__init__(*args, **kwargs)
+
+
+def detach_upload(model, validated_data, field):
+    """Подменяет загруженный файл именем, под которым его сохранит фон.
+
+    Возвращает содержимое для refresh_variants или None, если картинку
+    не загружали.
+    """
+    upload = validated_data.get(field)
+    if not isinstance(upload, UploadedFile):
+        return None
+    name = model._meta.get_field(field).generate_filename(None, upload.name)
+    validated_data[field] = name
+    return ContentFile(upload.read(), name=name)
+
+
+def render_variants(source, name, sizes):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        for size_name, size in sizes.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            for extension, image_format in FORMATS:
+                if image_format == 'JPEG' and resized.mode != 'RGB':
+                    resized = resized.convert('RGB')
+                buffer = BytesIO()
+                resized.save(buffer, image_format, quality=QUALITY)
+                variants.setdefault(size_name, {})[extension] = (
+                    default_storage.save(
+                        f'variants/{stem}_{size_name}.{extension}',
+                        ContentFile(buffer.getvalue())))
+    return variants
+
+
+def save_original(model, pk, field, file, upload):
+    name = file.storage.save(upload.name, upload)
+    if name != upload.name:
+        model.objects.filter(pk=pk, **{field: upload.name}).update(
+            **{field: name})
+        file.name = name
+
+
+def process(label, pk, field, variants_field, kind, upload=None):
+    model = apps.get_model(label)
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        file = getattr(instance, field, None)
+        if not file:
+            return
+        if upload is not None:
+            # Картинку уже заменили, этот оригинал никому не нужен.
+            if file.name != upload.name:
+                return
+            save_original(model, pk, field, file, upload)
+        with file.open('rb'):
+            variants = render_variants(file, file.name, SIZES[kind])
+        # Если картинку успели заменить, её копии нарежет следующая задача.
+        if model.objects.filter(pk=pk, **{field: file.name}).exists():
+            setattr(instance, variants_field, variants)
+            # save(), а не update(): сигналы сбрасывают кеш ответов.
+            instance.save(update_fields=[variants_field])
+            return variants
+        # Сигнал замены мог удалить файлы раньше, чем мы их записали.
+        delete_image(upload and file.name, variants)
+    except Exception:
+        logger.exception('Не удалось обработать %s %s.%s', label, pk, field)
+
+
+def run_in_background(job):
+    try:
+        return job()
+    finally:
+        # Соединение потока пула само не закрывается.
+        connection.close()
+
+
+def delete_variants(variants):
+    for formats in (variants or {}).values():
+        for path in formats.values():
+            default_storage.delete(path)
+
+
+def delete_image(name, variants):
+    if name:
+        default_storage.delete(name)
+    delete_variants(variants)
+
+
+def refresh_variants(instance, field, variants_field, kind, upload=None):
+    """Сбрасывает старые копии и ставит нарезку новых в очередь.
+
+    upload — содержимое из detach_upload: оригинал сохраняется вместе
+    с нарезкой. Файлы старых копий удаляет сигнал сохранения модели.
+    """
+    if getattr(instance, variants_field):
+        type(instance).objects.filter(pk=instance.pk).update(
+            **{variants_field: {}})
+        setattr(instance, variants_field, {})
+    if not getattr(instance, field):
+        return
+    job = partial(process, instance._meta.label, instance.pk,
+                  field, variants_field, kind, upload)
+    if getattr(settings, 'IMAGE_PROCESSING_SYNC', False):
+        setattr(instance, variants_field, job() or {})
+    else:
+        transaction.on_commit(
+            partial(executor.submit, run_in_background, job))
+
+
+def variant_urls(variants, request=None):
+    urls = {}
+    for size_name, formats in (variants or {}).items():
+        urls[size_name] = {}
+        for extension, path in formats.items():
+            url = default_storage.url(path)
+            urls[size_name][extension] = (
+                request.build_absolute_uri(url) if request else url)
+    return urls
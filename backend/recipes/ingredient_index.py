@@ -0,0 +1,75 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения по префиксу.
+
+Справочник ингредиентов маленький и почти не меняется, поэтому каждый
+воркер один раз загружает его в отсортированный список и отвечает на
+запросы бинарным поиском, не обращаясь к базе. Изменения ингредиентов
+увеличивают версию в кеше (см. bump_version); воркер, заметивший новую
+версию, перестраивает индекс. Если кеш не общий для воркеров, индекс всё
+равно перестраивается не реже раза в INGREDIENT_INDEX_MAX_AGE секунд.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Ingredient
+
+VERSION_KEY = 'ingredient-index-version'
+
+
+def bump_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def ingredients_changed():
+    """Справочник изменён: версия сменится после коммита.
+
+    Иначе воркер мог бы перестроить индекс по ещё не закоммиченным данным
+    и запомнить новую версию без изменений.
+    """
+    transaction.on_commit(bump_version)
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = ([], [])
+        self._version = None
+        self._built_at = None
+
+    def _build(self, version):
+        rows = sorted(
+            (name.casefold(), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'))
+        self._data = ([row[0] for row in rows], [row[1:] for row in rows])
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        version = cache.get(VERSION_KEY)
+        max_age = getattr(settings, 'INGREDIENT_INDEX_MAX_AGE', 300)
+        if (self._built_at is not None and version == self._version
+                and time.monotonic() - self._built_at < max_age):
+            return
+        with self._lock:
+            if self._built_at is None or version != self._version or (
+                    time.monotonic() - self._built_at >= max_age):
+                self._build(version)
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с prefix, по id."""
+        self._ensure_fresh()
+        keys, rows = self._data
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\U0010ffff', start)
+        return [
+            Ingredient(id=pk, name=name, measurement_unit=unit)
+            for pk, name, unit in sorted(rows[start:end])]
+
+
+index = IngredientIndex()
@@ -0,0 +1,143 @@
+"""Подбор рецептов по набору ингредиентов («готовлю из того, что есть»).
+
+Режимы: all — рецепты со всеми ингредиентами, any — хотя бы с одним,
+most — больше чем с половиной. Результат сортируется по покрытию: сколько
+из переданных ингредиентов есть в рецепте.
+
+По умолчанию списки рецептов по ингредиенту берутся из индекса
+(ingredient, recipe) в IngredientRecipe: один GROUP BY ... HAVING без
+соединения таблицы состава самой с собой на каждый ингредиент. С
+INGREDIENT_POSTINGS_IN_MEMORY воркер держит эти списки в памяти и
+пересекает их без базы; если совпадений больше INGREDIENT_POSTINGS_MAX_IDS,
+запрос всё равно уходит в базу, чтобы не передавать огромный IN (...).
+Версия списков в памяти меняется, только когда строки состава добавлены
+или удалены (см. postings_changed): количество и сохранение самого
+рецепта на списки не влияют.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (Case, Count, IntegerField, OuterRef, Subquery,
+                              Value, When)
+
+from .models import IngredientRecipe
+
+ALL = 'all'
+ANY = 'any'
+MOST = 'most'
+MODES = (ALL, ANY, MOST)
+VERSION_KEY = 'ingredient-postings-version'
+
+
+def bump_version():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def postings_changed():
+    """Строки состава добавлены или удалены: версия сменится после коммита."""
+    transaction.on_commit(bump_version)
+
+
+def threshold(mode, count):
+    """Минимальное покрытие рецепта для режима."""
+    return {ALL: count, ANY: 1, MOST: count // 2 + 1}[mode]
+
+
+class Postings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = None
+        self._built_at = None
+
+    def _build(self, version):
+        postings = defaultdict(set)
+        for ingredient_id, recipe_id in (
+                IngredientRecipe.objects
+                .values_list('ingredient_id', 'recipe_id')
+                .iterator(chunk_size=10000)):
+            postings[ingredient_id].add(recipe_id)
+        self._data = {
+            ingredient_id: frozenset(recipes)
+            for ingredient_id, recipes in postings.items()}
+        self._version = version
+        self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        version = cache.get(VERSION_KEY)
+        max_age = getattr(settings, 'INGREDIENT_INDEX_MAX_AGE', 300)
+        if (self._built_at is not None and version == self._version
+                and time.monotonic() - self._built_at < max_age):
+            return
+        with self._lock:
+            if self._built_at is None or version != self._version or (
+                    time.monotonic() - self._built_at >= max_age):
+                self._build(version)
+
+    def coverage(self, ingredient_ids, minimum):
+        """Словарь {id рецепта: покрытие} для рецептов с покрытием >= minimum."""
+        self._ensure_fresh()
+        data = self._data
+        lists = sorted((data.get(pk, frozenset()) for pk in ingredient_ids),
+                       key=len)
+        if minimum == len(lists):
+            return dict.fromkeys(frozenset.intersection(*lists), minimum)
+        counts = Counter()
+        for recipes in lists:
+            counts.update(recipes)
+        return {pk: count for pk, count in counts.items() if count >= minimum}
+
+
+postings = Postings()
+
+
+def _in_memory(queryset, ingredient_ids, minimum):
+    matches = postings.coverage(ingredient_ids, minimum)
+    if len(matches) > getattr(settings, 'INGREDIENT_POSTINGS_MAX_IDS', 1000):
+        return None
+    if minimum == len(ingredient_ids):
+        coverage = Value(minimum)
+    else:
+        groups = defaultdict(list)
+        for pk, count in matches.items():
+            groups[count].append(pk)
+        coverage = Case(
+            *(When(id__in=pks, then=Value(count))
+              for count, pks in groups.items()),
+            default=Value(0), output_field=IntegerField())
+    return queryset.filter(id__in=list(matches)).annotate(coverage=coverage)
+
+
+def _in_database(queryset, ingredient_ids, minimum):
+    rows = IngredientRecipe.objects.filter(
+        ingredient_id__in=ingredient_ids).order_by()
+    matches = (rows
+               .values('recipe_id')
+               .annotate(coverage=Count('ingredient_id'))
+               .filter(coverage__gte=minimum)
+               .values('recipe_id'))
+    coverage = (rows
+                .filter(recipe_id=OuterRef('pk'))
+                .values('recipe_id')
+                .annotate(coverage=Count('ingredient_id'))
+                .values('coverage'))
+    return queryset.filter(id__in=matches).annotate(
+        coverage=Subquery(coverage, output_field=IntegerField()))
+
+
+def filter_recipes(queryset, ingredient_ids, mode=ALL):
+    """Рецепты с нужным покрытием, от полного покрытия к меньшему."""
+    ingredient_ids = sorted(set(ingredient_ids))
+    if not ingredient_ids:
+        return queryset
+    minimum = threshold(mode, len(ingredient_ids))
+    result = None
+    if getattr(settings, 'INGREDIENT_POSTINGS_IN_MEMORY', False):
+        result = _in_memory(queryset, ingredient_ids, minimum)
+    if result is None:
+        result = _in_database(queryset, ingredient_ids, minimum)
+    return result.order_by('-coverage', '-pub_date', '-id')
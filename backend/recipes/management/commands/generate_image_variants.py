@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Generate missing resized variants for recipe images and avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        targets = (
+            (Recipe, 'image', 'image_variants', 'recipe'),
+            (User, 'avatar', 'avatar_variants', 'avatar'),
+        )
+        for model, field, variants_field, kind in targets:
+            queryset = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            if not options['all']:
+                queryset = queryset.filter(**{variants_field: {}})
+            count = 0
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                if images.process(model._meta.label, pk, field, variants_field, kind):
+                    count += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'Generated variants for {count} {model._meta.verbose_name_plural}'))
@@ -1,24 +1,105 @@
 import csv
+import hashlib
+import json
 import os
-from django.core.management.base import BaseCommand
-from recipes.models import Ingredient
+import re
+from itertools import islice
+from time import perf_counter
+
 from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import ingredient_index
+from recipes.models import DataImport, Ingredient
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8') as csvfile:
+        for row in csv.reader(csvfile):
+            if row:
+                yield row[0], row[1]
+
+
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_json(path, chunk_size=2 ** 16):
+    """Элементы JSON-массива по одному: файл не читается целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as jsonfile:
+        buffer = jsonfile.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError(f'{path}: expected a JSON array')
+        position = 1
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if buffer.startswith(']', position):
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Элемент оборвался на границе куска: дочитываем.
+                chunk = jsonfile.read(chunk_size)
+                if not chunk:
+                    raise CommandError(f'{path}: malformed JSON')
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients from CSV file'
-
-    def handle(self, *args, **kwargs):
-        file_path = os.path.join(settings.BASE_DIR.parent, 'data', 'ingredients.csv')
-        abs_path = os.path.abspath(file_path)
-
-        with open(abs_path, encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            count = 0
-            for row in reader:
-                name = row[0]
-                unit = row[1]
-                Ingredient.objects.get_or_create(name=name, measurement_unit=unit)
-                count += 1
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully loaded {count} ingredients'))
+    help = 'Load ingredients from CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR.parent, 'data', 'ingredients.csv'),
+            help='Path to ingredients.csv or ingredients.json')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--force', action='store_true',
+                            help='Import even if the file has not changed')
+
+    def handle(self, *args, **options):
+        abs_path = os.path.abspath(options['path'])
+        extension = os.path.splitext(abs_path)[1].lower()
+        if extension not in READERS:
+            raise CommandError(f'Unsupported file type: {extension}')
+        source = os.path.basename(abs_path)
+        checksum = file_checksum(abs_path)
+        if not options['force'] and DataImport.objects.filter(
+                source=source, checksum=checksum).exists():
+            self.stdout.write(f'{source} is unchanged since the last import, skipping')
+            return
+
+        start = perf_counter()
+        rows = READERS[extension](abs_path)
+        count = 0
+        with transaction.atomic():
+            before = Ingredient.objects.count()
+            while batch := list(islice(rows, options['batch_size'])):
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit) for name, unit in batch),
+                    ignore_conflicts=True)
+                count += len(batch)
+            # ignore_conflicts не сообщает, сколько строк вставлено.
+            created = Ingredient.objects.count() - before
+            DataImport.objects.update_or_create(
+                source=source, defaults={'checksum': checksum, 'rows': count})
+        ingredient_index.bump_version()
+        elapsed = perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully loaded {created} new ingredients from {count} rows '
+            f'in {elapsed:.2f}s ({count / elapsed if elapsed else count:.0f} rows/sec)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from recipes import scores
+
+
+class Command(BaseCommand):
+    help = ('Recompute popular and trending recipe scores from favorites '
+            'and shopping carts; run periodically, e.g. from cron')
+
+    def handle(self, *args, **options):
+        count = scores.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{count} recipe scores rebuilt'))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from recipes import search
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text recipe search index'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING(
+                f'Full-text index is not used on {connection.vendor}'))
+            return
+        started = time.monotonic()
+        with transaction.atomic():
+            search.create_index()
+            search.index_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Recipe.objects.count()} recipes '
+            f'in {time.monotonic() - started:.1f}s'))
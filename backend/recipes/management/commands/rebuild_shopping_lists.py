@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-user shopping list aggregate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare the table with carts, do not write')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Limit to the given user id (repeatable)')
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        if not options['verify']:
+            count = shopping_list.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} shopping list items'))
+            return
+        expected = shopping_list.expected_items(user_ids)
+        stored = shopping_list.stored_items(user_ids)
+        mismatched = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)}
+        for user_id, ingredient_id in sorted(mismatched):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'expected {expected.get((user_id, ingredient_id))}, '
+                f'stored {stored.get((user_id, ingredient_id))}')
+        if mismatched:
+            raise CommandError(f'{len(mismatched)} shopping list items are out of date')
+        self.stdout.write(self.style.SUCCESS(f'{len(stored)} shopping list items are up to date'))
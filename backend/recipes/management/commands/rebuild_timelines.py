@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from recipes import timeline
+
+
+class Command(BaseCommand):
+    help = ('Rebuild subscription feed timelines from current follows, '
+            'with every recipe of each followed author')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Limit to the given user id (repeatable)')
+
+    def handle(self, *args, **options):
+        timeline.rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS('Timelines rebuilt'))
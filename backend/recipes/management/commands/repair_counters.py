@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized favorite, cart, recipe and follower counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report counters that are out of date')
+
+    def handle(self, *args, **options):
+        mismatches = counters.mismatches()
+        for label, pk, field, stored, actual in mismatches:
+            self.stdout.write(f'{label} {pk} {field}: stored {stored}, actual {actual}')
+        if not options['dry_run']:
+            counters.recompute()
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(mismatches)} counters out of date'
+            + ('' if options['dry_run'] else ', repaired')))
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.21 on 2026-10-18 17:40
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_rows(model, owner, duplicate_id, kept_id, amount):
+    """Переносит строки model с duplicate_id на kept_id, складывая amount
+    там, где у того же владельца строка с kept_id уже есть."""
+    for row in model.objects.filter(ingredient_id=duplicate_id):
+        kept = model.objects.filter(
+            **{owner: getattr(row, owner)}, ingredient_id=kept_id)
+        if kept.exists():
+            kept.update(**{amount: F(amount) + getattr(row, amount)})
+            row.delete()
+        else:
+            row.ingredient_id = kept_id
+            row.save(update_fields=['ingredient'])
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = (Ingredient.objects
+              .values('name', 'measurement_unit')
+              .annotate(rows=Count('id'), kept=Min('id'))
+              .filter(rows__gt=1))
+    for group in list(groups):
+        duplicates = list(Ingredient.objects
+                          .filter(name=group['name'],
+                                  measurement_unit=group['measurement_unit'])
+                          .exclude(id=group['kept'])
+                          .values_list('id', flat=True))
+        for duplicate_id in duplicates:
+            merge_rows(IngredientRecipe, 'recipe_id', duplicate_id,
+                       group['kept'], 'amount')
+            merge_rows(ShoppingListItem, 'user_id', duplicate_id,
+                       group['kept'], 'total_amount')
+        Ingredient.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=200, unique=True, verbose_name='Источник')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Контрольная сумма')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Строк загружено')),
+                ('imported_at', models.DateTimeField(auto_now=True, verbose_name='Дата загрузки')),
+            ],
+            options={
+                'verbose_name': 'Загрузка данных',
+                'verbose_name_plural': 'Загрузки данных',
+            },
+        ),
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
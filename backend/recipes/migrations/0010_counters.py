@@ -0,0 +1,46 @@
+# Generated by Django 4.2.21 on 2026-10-18 17:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    counters = (
+        (Recipe, 'favorites_count', apps.get_model('recipes', 'Favorite'), 'recipe'),
+        (Recipe, 'shopping_cart_count', apps.get_model('recipes', 'ShoppingCart'), 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', apps.get_model('recipes', 'Follow'), 'author'),
+    )
+    for model, field, relation, lookup in counters:
+        model.objects.update(**{field: Coalesce(Subquery(
+            relation.objects
+            .filter(**{lookup: OuterRef('pk')})
+            .order_by()
+            .values(lookup)
+            .annotate(total=Count('pk'))
+            .values('total')), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_variants'),
+        ('users', '0009_user_followers_count_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+# SQL на момент миграции: recipes.search может меняться дальше.
+TABLE = 'recipes_recipe_search'
+
+DOCUMENTS = '''
+    SELECT r.id, r.name, COALESCE({aggregate}, ''), r.text
+    FROM recipes_recipe r
+    LEFT JOIN recipes_ingredientrecipe ir ON ir.recipe_id = r.id
+    LEFT JOIN recipes_ingredient i ON i.id = ir.ingredient_id
+    GROUP BY r.id, r.name, r.text
+'''
+
+POSTGRESQL = (
+    f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+    'recipe_id integer PRIMARY KEY, document tsvector NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {TABLE}_document_gin '
+    f'ON {TABLE} USING GIN (document)',
+    f'INSERT INTO {TABLE} (recipe_id, document) '
+    "SELECT id, setweight(to_tsvector('russian', name), 'A') "
+    "|| setweight(to_tsvector('russian', ingredients), 'B') "
+    "|| setweight(to_tsvector('russian', text), 'C') "
+    'FROM ('
+    + DOCUMENTS.format(aggregate="string_agg(i.name, ' ')")
+    + ') AS documents (id, name, ingredients, text)',
+)
+
+SQLITE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+    "name, ingredients, text, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f'INSERT INTO {TABLE} (rowid, name, ingredients, text) '
+    + DOCUMENTS.format(aggregate="group_concat(i.name, ' ')"),
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for statement in {'postgresql': POSTGRESQL, 'sqlite': SQLITE}.get(
+            vendor, ()):
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}', params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
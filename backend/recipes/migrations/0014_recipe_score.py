@@ -0,0 +1,64 @@
+# Generated by Django 4.2.21 on 2026-10-18 18:07
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Начало отсчёта recipes.scores.EPOCH.
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill_created(apps, schema_editor):
+    # Когда добавлены старые записи, неизвестно. С датой миграции они все
+    # разом попали бы в «популярное за последние дни», поэтому относим их
+    # к началу отсчёта оценок, и новые события весят больше них.
+    for name in ('Favorite', 'ShoppingCart'):
+        apps.get_model('recipes', name).objects.update(created=EPOCH)
+
+
+def create_scores(apps, schema_editor):
+    # Нулевые оценки, чтобы рецепты сразу попадали в рейтинги;
+    # сами оценки считает rebuild_recipe_scores.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=pk)
+         for pk in Recipe.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shortlink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Добавлен'),
+        ),
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность за последние дни')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+                'indexes': [models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'), models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_created, migrations.RunPython.noop),
+        migrations.RunPython(create_scores, migrations.RunPython.noop),
+    ]
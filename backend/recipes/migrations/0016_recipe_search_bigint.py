@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def widen_recipe_id(apps, schema_editor):
+    # Индекс создан в 0011 с колонкой integer, а id рецепта — bigint.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE recipes_recipe_search '
+            'ALTER COLUMN recipe_id TYPE bigint')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(widen_recipe_id, migrations.RunPython.noop),
+    ]
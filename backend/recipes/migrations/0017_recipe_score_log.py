@@ -0,0 +1,27 @@
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Exp, Ln
+
+
+def to_log_scores(apps, schema_editor):
+    # Оценки хранились суммой весов, теперь — ln(1 + сумма).
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.update(popular=Ln(F('popular') + 1.0),
+                               trending=Ln(F('trending') + 1.0))
+
+
+def from_log_scores(apps, schema_editor):
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.update(popular=Exp(F('popular')) - 1.0,
+                               trending=Exp(F('trending')) - 1.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_search_bigint'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_log_scores, from_log_scores),
+    ]
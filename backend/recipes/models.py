@@ -2,6 +2,7 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.db.models import Q, F
 from django.urls import reverse
+from django.utils import timezone
 from users.models import User
 
 
@@ -15,6 +16,8 @@ class Ingredient(models.Model):
         ordering = ['id']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'], name='unique_ingredient')]
 
     def __str__(self):
         return f'{self.name}'
@@ -31,9 +34,15 @@ class Recipe(models.Model):
                                                     help_text='Время приготовления рецепта в минутах')
     image = models.ImageField(verbose_name='Картинка рецепта', upload_to='',
                               help_text='Добавьте изображение рецепта')
+    image_variants = models.JSONField(verbose_name='Уменьшенные копии картинки',
+                                      default=dict, blank=True, editable=False)
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном', default=0, editable=False)
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок', default=0, editable=False)
 
     class Meta:
         ordering = ['-id']
@@ -42,6 +51,8 @@ class Recipe(models.Model):
         verbose_name_plural = 'Рецепты'
         constraints = [
             models.UniqueConstraint(fields=['name', 'author'], name='unique_recipe')]
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx')]
 
 
 class IngredientRecipe(models.Model):
@@ -60,6 +71,9 @@ class IngredientRecipe(models.Model):
             models.UniqueConstraint(
                 fields=['recipe', 'ingredient'],
                 name='unique_ingredients')]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='ingredient_recipe_idx')]
 
     def __str__(self):
         return f'{self.ingredient} {self.amount}'
@@ -73,6 +87,7 @@ class ShoppingCart(models.Model):
                                on_delete=models.CASCADE, verbose_name='Пользователь')
     recipe = models.ForeignKey(Recipe, related_name='shopping_cart', verbose_name='Рецепт для приготовления',
                                on_delete=models.CASCADE, help_text='Выберите рецепт')
+    created = models.DateTimeField(verbose_name='Добавлен', default=timezone.now)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -86,6 +101,7 @@ class ShoppingCart(models.Model):
 class Favorite(models.Model):
     author = models.ForeignKey(User, related_name='favorite', on_delete=models.CASCADE, verbose_name='Автор')
     recipe = models.ForeignKey(Recipe, related_name='favorite', on_delete=models.CASCADE, verbose_name='Рецепты')
+    created = models.DateTimeField(verbose_name='Добавлен', default=timezone.now)
 
     class Meta:
         verbose_name = 'Избранные рецепты'
@@ -111,3 +127,87 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'Пользователь {self.user} подписан на {self.author}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, related_name='timeline', on_delete=models.CASCADE,
+                             verbose_name='Подписчик')
+    recipe = models.ForeignKey(Recipe, related_name='timeline', on_delete=models.CASCADE,
+                               verbose_name='Рецепт')
+    author = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE,
+                               verbose_name='Автор')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'], name='unique_timeline_entry')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx')]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(User, related_name='shopping_list_items',
+                             on_delete=models.CASCADE, verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient, related_name='shopping_list_items',
+                                   on_delete=models.CASCADE, verbose_name='Ингредиент')
+    total_amount = models.IntegerField(verbose_name='Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводный список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'], name='unique_shopping_list_item')]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.total_amount}'
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(Recipe, related_name='score', on_delete=models.CASCADE,
+                                  primary_key=True, verbose_name='Рецепт')
+    popular = models.FloatField(verbose_name='Популярность', default=0)
+    trending = models.FloatField(verbose_name='Популярность за последние дни', default=0)
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'),
+            models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx')]
+
+    def __str__(self):
+        return f'{self.recipe_id} {self.popular:g} {self.trending:g}'
+
+
+class ShortLink(models.Model):
+    recipe = models.OneToOneField(Recipe, related_name='short_link', on_delete=models.CASCADE,
+                                  verbose_name='Рецепт')
+    code = models.CharField(verbose_name='Код', max_length=16, unique=True)
+    hits = models.PositiveBigIntegerField(verbose_name='Переходов', default=0)
+
+    class Meta:
+        verbose_name = 'Короткая ссылка'
+        verbose_name_plural = 'Короткие ссылки'
+
+    def __str__(self):
+        return self.code
+
+
+class DataImport(models.Model):
+    source = models.CharField(verbose_name='Источник', max_length=200, unique=True)
+    checksum = models.CharField(verbose_name='Контрольная сумма', max_length=64)
+    rows = models.PositiveIntegerField(verbose_name='Строк загружено', default=0)
+    imported_at = models.DateTimeField(verbose_name='Дата загрузки', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Загрузка данных'
+        verbose_name_plural = 'Загрузки данных'
+
+    def __str__(self):
+        return f'{self.source} {self.checksum[:8]}'
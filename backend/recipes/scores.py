@@ -0,0 +1,118 @@
+"""Рейтинги рецептов для ?ordering=popular и ?ordering=trending.
+
+Каждое добавление рецепта в избранное или корзину — событие, вклад
+которого затухает вдвое за RECIPE_POPULAR_HALF_LIFE_DAYS (popular) или
+RECIPE_TRENDING_HALF_LIFE_DAYS (trending) дней. Оценки считаются с прямым
+затуханием (forward decay): событие в момент t весит
+2 ** ((t - EPOCH) / период), а старые оценки не уменьшаются. Порядок
+рецептов тот же, что у честно затухающих сумм, но новое событие — один
+UPDATE, а пересчитывать все оценки со временем не нужно.
+
+Сами веса растут экспоненциально и через ~1000 периодов переполнили бы
+float, поэтому хранится логарифм: ln(1 + сумма весов). Он растёт
+линейно со временем, а порядок не меняется. Событие прибавляется как
+log-sum-exp (log_add), без возведения в степень больших чисел; у
+рецепта без событий оценка 0.
+
+RecipeScore целиком пересобирается из таблиц связей командой
+rebuild_recipe_scores (по cron): пересборка убирает вклад удалённых
+добавлений. Между пересборками оценки растут по сигналам.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Least, Ln
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+RANKINGS = ('popular', 'trending')
+
+# Оценки изменились: отданные списки по рейтингу устарели.
+scores_changed = Signal()
+
+
+def half_lives():
+    return {
+        'popular': getattr(settings, 'RECIPE_POPULAR_HALF_LIFE_DAYS', 30),
+        'trending': getattr(settings, 'RECIPE_TRENDING_HALF_LIFE_DAYS', 3),
+    }
+
+
+def weights(moment):
+    """Логарифмы весов события в момент moment."""
+    days = (moment - EPOCH).total_seconds() / 86400
+    return {name: days / half_life * math.log(2)
+            for name, half_life in half_lives().items()}
+
+
+def log_add(current, value):
+    """ln(e ** current + e ** value) без переполнения."""
+    high, low = max(current, value), min(current, value)
+    return high + math.log1p(math.exp(low - high))
+
+
+def log_add_sql(field, value):
+    """То же для UPDATE: field := ln(e ** field + e ** value)."""
+    value = Value(value, output_field=FloatField())
+    # exp() ниже ~-745 в PostgreSQL — ошибка, а не ноль.
+    difference = Least(Abs(F(field) - value), Value(700.0))
+    return Greatest(F(field), value) + Ln(Value(1.0) + Exp(-difference))
+
+
+def create(recipe_ids):
+    RecipeScore.objects.bulk_create(
+        [RecipeScore(recipe_id=pk) for pk in recipe_ids],
+        ignore_conflicts=True)
+
+
+def bump(recipe_ids, moment=None):
+    """Учитывает добавление рецептов в избранное или корзину."""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    added = weights(moment or timezone.now())
+    updated = RecipeScore.objects.filter(recipe_id__in=recipe_ids).update(
+        **{name: log_add_sql(name, value) for name, value in added.items()})
+    if updated < len(recipe_ids):
+        # Рецепты, созданные в обход сигналов, до первой пересборки.
+        existing = set(RecipeScore.objects.filter(recipe_id__in=recipe_ids)
+                       .values_list('recipe_id', flat=True))
+        RecipeScore.objects.bulk_create(
+            [RecipeScore(recipe_id=pk, **{
+                name: log_add(0.0, value) for name, value in added.items()})
+             for pk in recipe_ids - existing],
+            ignore_conflicts=True)
+    scores_changed.send(sender=RecipeScore)
+
+
+@transaction.atomic
+def rebuild():
+    totals = {pk: dict.fromkeys(RANKINGS, 0.0)
+              for pk in Recipe.objects.values_list('pk', flat=True)}
+    for model in (Favorite, ShoppingCart):
+        events = model.objects.values_list('recipe_id', 'created')
+        for recipe_id, created in events.iterator(chunk_size=2000):
+            values = totals[recipe_id]
+            for name, value in weights(created).items():
+                values[name] = log_add(values[name], value)
+    RecipeScore.objects.all().delete()
+    RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=pk, **values) for pk, values in totals.items()),
+        batch_size=1000)
+    scores_changed.send(sender=RecipeScore)
+    return len(totals)
+
+
+def order(queryset, ranking):
+    """Рецепты по убыванию оценки; rank — ключ для пагинации курсором."""
+    return (queryset
+            .filter(score__isnull=False)
+            .annotate(rank=F(f'score__{ranking}'))
+            .order_by('-rank', '-id'))
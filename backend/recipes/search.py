@@ -0,0 +1,156 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+Индекс хранится рядом с данными и обновляется при записи рецепта:
+на PostgreSQL это таблица с колонкой tsvector и GIN-индексом, на SQLite —
+виртуальная таблица FTS5 с rowid, равным id рецепта. Название весит
+больше ингредиентов, ингредиенты — больше описания. На прочих СУБД
+поиск сводится к icontains без ранжирования.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+TABLE = 'recipes_recipe_search'
+CONFIG = 'russian'
+WORD = re.compile(r'\w+')
+
+# Документ рецепта: название, имена ингредиентов через пробел, описание.
+DOCUMENTS = '''
+    SELECT r.id, r.name, COALESCE({aggregate}, ''), r.text
+    FROM recipes_recipe r
+    LEFT JOIN recipes_ingredientrecipe ir ON ir.recipe_id = r.id
+    LEFT JOIN recipes_ingredient i ON i.id = ir.ingredient_id
+    {where}
+    GROUP BY r.id, r.name, r.text
+'''
+POSTGRESQL_DOCUMENTS = f'''
+    SELECT id, setweight(to_tsvector('{CONFIG}', name), 'A')
+        || setweight(to_tsvector('{CONFIG}', ingredients), 'B')
+        || setweight(to_tsvector('{CONFIG}', text), 'C')
+    FROM ({{documents}}) AS documents (id, name, ingredients, text)
+'''
+
+
+def is_supported(using=None):
+    return (using or connection).vendor in ('postgresql', 'sqlite')
+
+
+def create_index(using=None):
+    using = using or connection
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'recipe_id bigint PRIMARY KEY, document tsvector NOT NULL)')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {TABLE}_document_gin '
+                f'ON {TABLE} USING GIN (document)')
+        elif using.vendor == 'sqlite':
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+                "name, ingredients, text, "
+                "tokenize='unicode61 remove_diacritics 2')")
+
+
+def drop_index(using=None):
+    using = using or connection
+    if is_supported(using):
+        with using.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def _documents(using, recipe_ids):
+    where, params = '', []
+    if recipe_ids is not None:
+        where = f'WHERE r.id IN ({", ".join(["%s"] * len(recipe_ids))})'
+        params = list(recipe_ids)
+    if using.vendor == 'postgresql':
+        aggregate = "string_agg(i.name, ' ')"
+    else:
+        aggregate = "group_concat(i.name, ' ')"
+    return DOCUMENTS.format(aggregate=aggregate, where=where), params
+
+
+def remove(recipe_ids, using=None):
+    using = using or connection
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids or not is_supported(using):
+        return
+    column = 'recipe_id' if using.vendor == 'postgresql' else 'rowid'
+    with using.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE {column} IN '
+            f'({", ".join(["%s"] * len(recipe_ids))})', recipe_ids)
+
+
+def index_recipes(recipe_ids=None, using=None):
+    """Переиндексирует указанные рецепты, а без recipe_ids — все."""
+    using = using or connection
+    if not is_supported(using):
+        return
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        remove(recipe_ids, using)
+    else:
+        with using.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+    documents, params = _documents(using, recipe_ids)
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(
+                f'INSERT INTO {TABLE} (recipe_id, document) '
+                + POSTGRESQL_DOCUMENTS.format(documents=documents), params)
+        else:
+            cursor.execute(
+                f'INSERT INTO {TABLE} (rowid, name, ingredients, text) '
+                + documents, params)
+
+
+def _query(term, vendor):
+    words = WORD.findall(term)
+    if not words:
+        return None
+    # Каждое слово ищется как префикс, все слова должны найтись.
+    if vendor == 'postgresql':
+        return ' & '.join(f'{word}:*' for word in words)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(queryset, term):
+    """Оставляет рецепты, подходящие под term, и сортирует по релевантности."""
+    vendor = connection.vendor
+    if not is_supported():
+        words = WORD.findall(term) or [term]
+        condition = Q()
+        for word in words:
+            condition &= (Q(name__icontains=word)
+                          | Q(text__icontains=word)
+                          | Q(recipe_ingredients__ingredient__name__icontains=word))
+        return queryset.filter(condition).distinct()
+    query = _query(term, vendor)
+    if query is None:
+        return queryset.none()
+    if vendor == 'postgresql':
+        matches = (f'SELECT recipe_id FROM {TABLE} WHERE document '
+                   f"@@ to_tsquery('{CONFIG}', %s)")
+        # ts_rank возвращает real: без приведения сравнение с позицией
+        # курсора (double) не совпадает с самим значением.
+        rank = (f"SELECT ts_rank(document, to_tsquery('{CONFIG}', %s))"
+                f'::double precision '
+                f'FROM {TABLE} WHERE recipe_id = recipes_recipe.id')
+        order = '-search_rank'
+    else:
+        matches = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+        # bm25 тем меньше, чем документ релевантнее.
+        rank = (f'SELECT bm25({TABLE}, 10.0, 4.0, 1.0) FROM {TABLE} '
+                f'WHERE {TABLE} MATCH %s AND rowid = recipes_recipe.id')
+        order = 'search_rank'
+    return (queryset
+            .filter(id__in=RawSQL(matches, (query,)))
+            .annotate(search_rank=RawSQL(
+                rank, (query,), output_field=FloatField()))
+            .order_by(order, '-pub_date', '-id'))
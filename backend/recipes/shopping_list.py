@@ -0,0 +1,145 @@
+"""Сводный список покупок: (пользователь, ингредиент, общее количество).
+
+Таблица ShoppingListItem обновляется инкрементально при изменении корзины
+и состава рецептов, поэтому скачивание списка покупок — это простое чтение
+по индексу, а не агрегат по ShoppingCart и IngredientRecipe.
+
+Строки списка меняются только под блокировкой строк их пользователей
+(lock_users), иначе параллельные добавления одного ингредиента оба решат,
+что строки ещё нет, и второй INSERT упрётся в unique_shopping_list_item.
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem, User
+
+BATCH_SIZE = 1000
+
+
+def recipe_amounts(recipe_ids):
+    return Counter(dict(
+        IngredientRecipe.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .values_list('ingredient_id', 'total')))
+
+
+def lock_users(user_ids):
+    """Блокирует строки пользователей до конца транзакции.
+
+    Строки берутся по возрастанию id, чтобы транзакции с пересекающимися
+    наборами пользователей не ждали друг друга по кругу.
+    """
+    users = User.objects.filter(pk__in=user_ids)
+    if connection.features.has_select_for_update:
+        list(users.select_for_update().order_by('pk')
+             .values_list('pk', flat=True))
+    else:
+        # SQLite блокирует на запись всю базу, и чтение перед записью в
+        # параллельных транзакциях падает с «database is locked». Пустой
+        # UPDATE берёт блокировку записи сразу.
+        users.update(id=F('id'))
+
+
+@transaction.atomic
+def apply_deltas(user_ids, deltas):
+    """Прибавляет deltas {ingredient_id: количество} к спискам user_ids."""
+    user_ids = list(user_ids)
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not user_ids or not deltas:
+        return
+    lock_users(user_ids)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    if existing:
+        items.update(total_amount=F('total_amount') + Case(
+            *(When(ingredient_id=key, then=Value(value))
+              for key, value in deltas.items()),
+            default=Value(0), output_field=IntegerField()))
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=key,
+                          total_amount=value)
+         for user_id in user_ids
+         for key, value in deltas.items()
+         if value > 0 and (user_id, key) not in existing),
+        batch_size=BATCH_SIZE)
+    items.filter(total_amount__lte=0).delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_deltas([user_id], recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    amounts = recipe_amounts(recipe_ids)
+    apply_deltas([user_id], {key: -value for key, value in amounts.items()})
+
+
+def recipe_ingredients_changed(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки всех, у кого он в корзине."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe).values_list('author_id', flat=True)
+    apply_deltas(user_ids, deltas)
+
+
+@contextmanager
+def tracking(recipe_ids):
+    """Переносит в списки покупок изменения состава рецептов внутри блока.
+
+    Для правок по одной строке (админка), которые не проходят через
+    recipe_ingredients_changed.
+    """
+    recipe_ids = set(recipe_ids)
+    with transaction.atomic():
+        before = {pk: recipe_amounts([pk]) for pk in recipe_ids}
+        yield
+        for pk in recipe_ids:
+            recipe_ingredients_changed(pk, before[pk], recipe_amounts([pk]))
+
+
+def expected_items(user_ids=None):
+    rows = IngredientRecipe.objects.filter(
+        recipe__shopping_cart__isnull=False)
+    if user_ids is not None:
+        rows = rows.filter(recipe__shopping_cart__author_id__in=user_ids)
+    return {
+        (row['recipe__shopping_cart__author'], row['ingredient']):
+            row['total']
+        for row in rows
+        .values('recipe__shopping_cart__author', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    }
+
+
+def stored_items(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total
+        in items.values_list('user_id', 'ingredient_id', 'total_amount')
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    expected = expected_items(user_ids)
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          total_amount=total)
+         for (user_id, ingredient_id), total in expected.items()),
+        batch_size=BATCH_SIZE)
+    return len(expected)
@@ -0,0 +1,179 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import (counters, images, ingredient_index, ingredient_sets, scores,
+               search, shopping_list, timeline, user_lists)
+from .models import (Favorite, Follow, Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCart, User)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(instance.author_id, [instance.recipe_id])
+
+
+# pre_delete, а не post_delete: при каскадном удалении рецепта его состав
+# к моменту post_delete уже может быть удалён.
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    if user_lists.defer_removal(instance):
+        return
+    shopping_list.remove_recipes(instance.author_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    ingredient_index.ingredients_changed()
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, 'favorites_count', [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    if user_lists.defer_removal(instance):
+        return
+    counters.change(Recipe, 'favorites_count', [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_counted(sender, instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, 'shopping_cart_count', [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_uncounted(sender, instance, **kwargs):
+    if user_lists.defer_removal(instance):
+        return
+    counters.change(Recipe, 'shopping_cart_count', [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, 'recipes_count', [instance.author_id], 1)
+        scores.create([instance.pk])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_scored(sender, instance, created, **kwargs):
+    if created:
+        scores.bump([instance.recipe_id], instance.created)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    counters.change(User, 'recipes_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(User, 'followers_count', [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    counters.change(User, 'followers_count', [instance.author_id], -1)
+
+
+# Состав рецепта пишется после сохранения самого рецепта, поэтому
+# поисковый документ собирается уже после коммита.
+@receiver(post_save, sender=Recipe)
+def recipe_reindexed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'name', 'text'} & set(update_fields):
+        return
+    transaction.on_commit(partial(search.index_recipes, [instance.pk]))
+
+
+# Правки состава в админке идут по одной строке, без сохранения рецепта.
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_reindexed(sender, instance, update_fields=None,
+                                **kwargs):
+    if update_fields and set(update_fields) <= {'amount'}:
+        return
+    transaction.on_commit(partial(search.index_recipes, [instance.recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_unindexed(sender, instance, **kwargs):
+    search.remove([instance.pk])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_reindexed(sender, instance, created, **kwargs):
+    if not created:
+        transaction.on_commit(partial(
+            search.index_recipes,
+            list(instance.ingredientrecipe_set.values_list(
+                'recipe_id', flat=True))))
+
+
+# Удаление рецепта каскадом удаляет строки состава с сигналами. Массовую
+# вставку состава API отмечает само (см. RecipeSerializer.add_ingredients).
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'amount'}:
+        return
+    ingredient_sets.postings_changed()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(timeline.publish, instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+def timeline_followed(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(
+            timeline.backfill, instance.user_id, instance.author_id))
+
+
+@receiver(post_delete, sender=Follow)
+def timeline_unfollowed(sender, instance, **kwargs):
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+IMAGE_FIELDS = {
+    Recipe: ('image', 'image_variants'),
+    User: ('avatar', 'avatar_variants'),
+}
+
+
+# Файлы удаляются после коммита: при откате они ещё нужны.
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def image_replaced(sender, instance, update_fields=None, **kwargs):
+    field, variants_field = IMAGE_FIELDS[sender]
+    if instance._state.adding or (
+            update_fields is not None and field not in update_fields):
+        return
+    old = sender.objects.filter(pk=instance.pk).values(
+        field, variants_field).first()
+    if old and old[field] and old[field] != getattr(instance, field).name:
+        transaction.on_commit(partial(
+            images.delete_image, old[field], old[variants_field]))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_removed(sender, instance, **kwargs):
+    field, variants_field = IMAGE_FIELDS[sender]
+    transaction.on_commit(partial(
+        images.delete_image, getattr(instance, field).name,
+        getattr(instance, variants_field)))
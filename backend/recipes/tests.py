@@ -1,3 +1,269 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import Client, override_settings
+from rest_framework.test import APIClient
+
+from api.tests import ApiTestCase, create_recipes, create_user
+from recipes import counters, shopping_list
+from recipes.management.commands import load_ingredients
+from recipes.models import (Ingredient, IngredientRecipe, Recipe,
+                            ShoppingListItem, User)
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+         'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQI'
+         '12NgAAAAAgAB4iG8MwAAAABJRU5ErkJggg==')
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ShoppingListAggregateTest(ApiTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.buyer = create_user('buyer')
+        cls.salt, cls.sugar, cls.milk = Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('соль', 'сахар', 'молоко'))
+        cls.first, cls.second = create_recipes(
+            cls.author, 2, [cls.salt, cls.sugar])
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def assertShoppingList(self, expected):
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.buyer)
+                 .values_list('ingredient_id', 'total_amount')),
+            expected)
+        self.assertEqual(shopping_list.stored_items(),
+                         shopping_list.expected_items())
+
+    def test_cart_changes(self):
+        self.client.post(f'/api/recipes/{self.first.id}/shopping_cart/')
+        self.client.post(f'/api/recipes/{self.second.id}/shopping_cart/')
+        self.assertShoppingList({self.salt.id: 10, self.sugar.id: 10})
+        self.client.delete(f'/api/recipes/{self.first.id}/shopping_cart/')
+        self.assertShoppingList({self.salt.id: 5, self.sugar.id: 5})
+        self.second.delete()
+        self.assertShoppingList({})
+
+    def test_recipe_ingredients_changed(self):
+        self.client.post(f'/api/recipes/{self.first.id}/shopping_cart/')
+        response = self.author_client.patch(
+            f'/api/recipes/{self.first.id}/',
+            {'ingredients': [{'id': self.salt.id, 'amount': 7},
+                             {'id': self.milk.id, 'amount': 200}],
+             'image': IMAGE, 'name': 'Новое название', 'text': 'Описание',
+             'cooking_time': 5},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertShoppingList({self.salt.id: 7, self.milk.id: 200})
+
+    def test_admin_ingredient_edits(self):
+        self.client.post(f'/api/recipes/{self.first.id}/shopping_cart/')
+        admin = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password='Pa55word!')
+        client = Client()
+        client.force_login(admin)
+        row = IngredientRecipe.objects.get(recipe=self.first, ingredient=self.salt)
+        response = client.post(
+            f'/admin/recipes/ingredientrecipe/{row.id}/change/',
+            {'recipe': self.first.id, 'ingredient': self.milk.id,
+             'amount': 30})
+        self.assertEqual(response.status_code, 302)
+        self.assertShoppingList({self.milk.id: 30, self.sugar.id: 5})
+        row = IngredientRecipe.objects.get(recipe=self.first, ingredient=self.sugar)
+        client.post(f'/admin/recipes/ingredientrecipe/{row.id}/delete/',
+                    {'post': 'yes'})
+        self.assertShoppingList({self.milk.id: 30})
+
+    def test_rebuild_command(self):
+        self.client.post(f'/api/recipes/{self.first.id}/shopping_cart/')
+        ShoppingListItem.objects.filter(ingredient=self.salt).update(
+            total_amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--verify',
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertShoppingList({self.salt.id: 5, self.sugar.id: 5})
+
+
+class LoadIngredientsTest(ApiTestCase):
+    def test_load_is_idempotent(self):
+        path = os.path.join(settings.BASE_DIR.parent, 'data', 'ingredients.json')
+        call_command('load_ingredients', '--path', path, stdout=StringIO())
+        count = Ingredient.objects.count()
+        self.assertGreater(count, 2000)
+        output = StringIO()
+        with self.assertNumQueries(1):
+            call_command('load_ingredients', '--path', path, stdout=output)
+        self.assertIn('unchanged', output.getvalue())
+        output = StringIO()
+        call_command('load_ingredients', '--path', path, '--force',
+                     stdout=output)
+        self.assertEqual(Ingredient.objects.count(), count)
+        self.assertIn('loaded 0 new ingredients', output.getvalue())
+
+    def test_json_read_in_chunks(self):
+        path = os.path.join(settings.BASE_DIR.parent, 'data', 'ingredients.json')
+        with open(path, encoding='utf-8') as source:
+            expected = [(item['name'], item['measurement_unit'])
+                        for item in json.load(source)]
+        self.assertEqual(
+            list(load_ingredients.read_json(path, chunk_size=7)), expected)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteQueriesTest(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(40))
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def payload(self, ingredients, amount):
+        return {'ingredients': [{'id': ingredient.id, 'amount': amount}
+                                for ingredient in ingredients],
+                'image': IMAGE, 'name': 'Рецепт', 'text': 'Описание',
+                'cooking_time': 5}
+
+    @override_settings(IMAGE_PROCESSING_SYNC=False)
+    def test_bulk_create_and_diff_update(self):
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                '/api/recipes/', self.payload(self.ingredients[:30], 10),
+                format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe_id = Recipe.objects.get(author=self.author).id
+        self.assertEqual(len(response.data['ingredients']), 30)
+        payload = self.payload(self.ingredients[10:40], 10)
+        payload['ingredients'][0]['amount'] = 20
+        response = self.client.patch(
+            f'/api/recipes/{recipe_id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            {item['id']: item['amount']
+             for item in response.data['ingredients']},
+            {item['id']: item['amount'] for item in payload['ingredients']})
+
+    def test_unknown_ingredient(self):
+        payload = self.payload(self.ingredients[:1], 10)
+        payload['ingredients'].append({'id': 10 ** 6, 'amount': 1})
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageVariantsTest(ApiTestCase):
+    def test_recipe_and_avatar_variants(self):
+        user = create_user('author')
+        client = APIClient()
+        client.force_authenticate(user)
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        client.post('/api/recipes/', {
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            'image': IMAGE, 'name': 'Рецепт', 'text': 'Описание',
+            'cooking_time': 5}, format='json')
+        response = client.get('/api/recipes/')
+        variants = response.data['results'][0]['image_variants']
+        self.assertEqual(set(variants), {'card', 'detail'})
+        self.assertTrue(variants['card']['webp'].endswith('_card.webp'))
+        client.put('/api/users/me/avatar/', {'avatar': IMAGE}, format='json')
+        response = client.get('/api/users/me/')
+        self.assertEqual(set(response.data['avatar_variants']['avatar']),
+                         {'webp', 'jpeg'})
+
+    def test_replaced_and_deleted_files_removed(self):
+        user = create_user('author')
+        client = APIClient()
+        client.force_authenticate(user)
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        payload = {
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            'image': IMAGE, 'name': 'Рецепт', 'text': 'Описание',
+            'cooking_time': 5}
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/api/recipes/', payload, format='json')
+        recipe = Recipe.objects.get(name='Рецепт')
+        old_files = [recipe.image.name] + [
+            path for formats in recipe.image_variants.values()
+            for path in formats.values()]
+        self.assertTrue(all(
+            os.path.exists(os.path.join(MEDIA_ROOT, name))
+            for name in old_files))
+        with self.captureOnCommitCallbacks(execute=True):
+            client.patch(f'/api/recipes/{recipe.id}/', payload, format='json')
+        self.assertFalse(any(
+            os.path.exists(os.path.join(MEDIA_ROOT, name))
+            for name in old_files))
+        recipe.refresh_from_db()
+        new_files = [recipe.image.name] + [
+            path for formats in recipe.image_variants.values()
+            for path in formats.values()]
+        self.assertEqual(len(new_files), 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertFalse(any(
+            os.path.exists(os.path.join(MEDIA_ROOT, name))
+            for name in new_files))
+
+
+class CountersTest(ApiTestCase):
+    def test_counters_follow_changes(self):
+        author = create_user('author')
+        reader = create_user('reader')
+        client = APIClient()
+        client.force_authenticate(reader)
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Описание', cooking_time=1,
+            image='recipe.png')
+        client.post(f'/api/recipes/{recipe.id}/favorite/')
+        client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        client.post(f'/api/users/{author.id}/subscribe/')
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count,
+             author.recipes_count, author.followers_count), (1, 1, 1, 1))
+        client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(
+            client.get('/api/users/subscriptions/').data['results'][0]
+            ['recipes_count'], 1)
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        call_command('repair_counters', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assertEqual(counters.mismatches(), [])
+        recipe.delete()
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 0)
+        self.assertIsNotNone(ingredient.pk)
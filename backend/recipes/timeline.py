@@ -0,0 +1,110 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт после коммита раскладывается по лентам подписчиков автора
+(fan-out on write): строки TimelineEntry пишутся пачками по BATCH_SIZE.
+Лента читается по индексу (user, -pub_date, -recipe) без JOIN с Follow,
+и с курсором любая её страница стоит столько же, сколько первая.
+
+Авторов, у которых больше FEED_FAN_OUT_MAX_FOLLOWERS подписчиков, по
+лентам не раскладываем: один их рецепт дал бы слишком много строк. Их
+рецепты подмешиваются в ленту при чтении (fan-out on read).
+
+При подписке в ленту попадают последние FEED_BACKFILL_SIZE рецептов
+автора, при отписке его рецепты из ленты удаляются. Если автор
+опустится ниже порога, рецепты, вышедшие, пока он был выше, в ленты не
+попадут. Команда rebuild_timelines кладёт в ленты все рецепты авторов,
+включая и эти, и более старые, чем попали при подписке.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import Follow, Recipe, TimelineEntry, User
+
+BATCH_SIZE = 1000
+
+
+def max_followers():
+    return getattr(settings, 'FEED_FAN_OUT_MAX_FOLLOWERS', 1000)
+
+
+def entries(user_ids, recipe):
+    return (TimelineEntry(user_id=user_id, recipe_id=recipe.pk,
+                          author_id=recipe.author_id,
+                          pub_date=recipe.pub_date)
+            for user_id in user_ids)
+
+
+def save(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def publish(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора."""
+    recipe = (Recipe.objects.filter(pk=recipe_id).select_related('author')
+              .only('pub_date', 'author', 'author__followers_count').first())
+    if recipe is None or recipe.author.followers_count > max_followers():
+        return
+    followers = (Follow.objects.filter(author_id=recipe.author_id)
+                 .values_list('user_id', flat=True)
+                 .iterator(chunk_size=BATCH_SIZE))
+    save(entries(followers, recipe))
+
+
+def backfill(user_id, author_id, full=False):
+    """Рецепты автора в ленту подписчика.
+
+    Только последние FEED_BACKFILL_SIZE, а с full — все.
+    """
+    if (User.objects.filter(pk=author_id).values_list(
+            'followers_count', flat=True).first() or 0) > max_followers():
+        return
+    recipes = (Recipe.objects.filter(author_id=author_id)
+               .order_by('-pub_date', '-id')
+               .only('author_id', 'pub_date'))
+    if not full:
+        recipes = recipes[:getattr(settings, 'FEED_BACKFILL_SIZE', 50)]
+    save(entry for recipe in recipes.iterator(chunk_size=BATCH_SIZE)
+         for entry in entries([user_id], recipe))
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Заново собирает ленты по текущим подпискам со всеми рецептами авторов."""
+    follows = Follow.objects.all()
+    timelines = TimelineEntry.objects.all()
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        timelines = timelines.filter(user_id__in=user_ids)
+    timelines.delete()
+    pairs = follows.values_list('user_id', 'author_id')
+    for user_id, author_id in pairs.iterator(chunk_size=BATCH_SIZE):
+        backfill(user_id, author_id, full=True)
+
+
+def feed(queryset, user):
+    """Рецепты ленты; feed_date — ключ сортировки и курсора."""
+    popular = list(
+        Follow.objects
+        .filter(user=user, author__followers_count__gt=max_followers())
+        .values_list('author_id', flat=True))
+    if not popular:
+        # Только своя лента: диапазон индекса по пользователю.
+        return (queryset.filter(timeline__user=user)
+                .annotate(feed_date=F('timeline__pub_date')))
+    return (queryset
+            .filter(Q(Exists(TimelineEntry.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+                | Q(author_id__in=popular))
+            .annotate(feed_date=F('pub_date')))
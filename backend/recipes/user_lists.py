@@ -0,0 +1,138 @@
+"""Добавление рецептов в избранное и корзину и удаление из них.
+
+Одиночное добавление — один INSERT: повтор, в том числе параллельный,
+упирается в уникальное ограничение и не ломает запрос. Одиночное
+удаление — обычный queryset.delete(): счётчики и список покупок меняют
+сигналы signals.py, только если строка действительно удалена, поэтому
+двойной клик не вычитает дважды.
+
+Пачка проверяется одним запросом, пишется одним bulk_create или одним
+delete(). bulk_create сигналов не шлёт, а сигналы удаления внутри
+пачки только запоминают рецепты удалённых строк (defer_removal). Поэтому
+счётчики и список покупок, которые для одиночных записей ведёт
+signals.py, здесь меняются сразу для всей пачки.
+
+Все изменения списков пользователя начинаются с блокировки его строки
+(lock), поэтому идут по очереди: снимок present() внутри транзакции
+точен, и счётчики меняются только для строк, которые действительно
+вставлены или удалены.
+"""
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+
+from . import counters, scores, shopping_list
+from .models import Favorite, Recipe, ShoppingCart
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+# Рецепты строк, удалённых текущим пакетным remove.
+deferred_removals = ContextVar('deferred_removals', default=None)
+
+
+def lock(user):
+    """Блокирует строку пользователя до конца транзакции."""
+    shopping_list.lock_users([user.pk])
+
+
+def present(model, user, recipe_ids):
+    """{id рецепта: есть ли он в списке} для существующих рецептов."""
+    return dict(
+        Recipe.objects
+        .filter(pk__in=recipe_ids)
+        .annotate(present=Exists(model.objects.filter(
+            author=user, recipe=OuterRef('pk'))))
+        .values_list('pk', 'present'))
+
+
+def changed(model, user_id, recipe_ids, delta):
+    """То же, что сигналы signals.py делают для одной записи."""
+    if not recipe_ids:
+        return
+    counters.change(Recipe, COUNTER_FIELDS[model], recipe_ids, delta)
+    if delta > 0:
+        scores.bump(recipe_ids)
+    if model is ShoppingCart:
+        if delta > 0:
+            shopping_list.add_recipes(user_id, recipe_ids)
+        else:
+            shopping_list.remove_recipes(user_id, recipe_ids)
+
+
+def add_one(model, user, recipe):
+    """Добавляет рецепт в список; None, если он там уже есть."""
+    with transaction.atomic():
+        lock(user)
+        try:
+            with transaction.atomic():
+                return model.objects.create(author=user, recipe=recipe)
+        except IntegrityError:
+            return None
+
+
+@transaction.atomic
+def remove_one(model, user, recipe_id):
+    """Убирает рецепт из списка; False, если его там не было."""
+    lock(user)
+    deleted, _ = model.objects.filter(
+        author=user, recipe_id=recipe_id).delete()
+    return bool(deleted)
+
+
+def defer_removal(instance):
+    """Для сигналов удаления: True, если строку учтёт пакетный remove."""
+    removed = deferred_removals.get()
+    if removed is None:
+        return False
+    removed.add(instance.recipe_id)
+    return True
+
+
+def delete(queryset):
+    """Удаляет строки и возвращает множество id их рецептов."""
+    removed = set()
+    token = deferred_removals.set(removed)
+    try:
+        queryset.delete()
+    finally:
+        deferred_removals.reset(token)
+    return removed
+
+
+@transaction.atomic
+def add(model, user, recipe_ids):
+    """Добавляет рецепты в список, возвращает {id рецепта: статус}."""
+    lock(user)
+    states = present(model, user, recipe_ids)
+    new = [pk for pk, exists in states.items() if not exists]
+    model.objects.bulk_create(
+        [model(author=user, recipe_id=pk) for pk in new],
+        ignore_conflicts=True)
+    changed(model, user.pk, new, 1)
+    return {pk: NOT_FOUND if pk not in states
+            else EXISTS if states[pk] else ADDED
+            for pk in recipe_ids}
+
+
+@transaction.atomic
+def remove(model, user, recipe_ids):
+    """Убирает рецепты из списка, возвращает {id рецепта: статус}."""
+    lock(user)
+    states = present(model, user, recipe_ids)
+    removed = delete(model.objects.filter(
+        author=user,
+        recipe_id__in=[pk for pk, exists in states.items() if exists]))
+    changed(model, user.pk, sorted(removed), -1)
+    return {pk: NOT_FOUND if pk not in states
+            else REMOVED if pk in removed else MISSING
+            for pk in recipe_ids}
@@ -16,6 +16,9 @@ class User(AbstractUser):
     email = models.EmailField('email-адрес', unique=True)
     role = models.CharField(max_length=100, choices=ROLE_USER, default=USER)
     avatar = models.ImageField(upload_to='', null=True, blank=True, max_length=2**20)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0, editable=False)
     password = models.CharField(max_length=150, verbose_name='Пароль')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name', 'avatar']
@@ -2,18 +2,26 @@ from rest_framework import serializers
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from djoser.serializers import TokenCreateSerializer
-from drf_extra_fields.fields import Base64ImageField
+from recipes import images
 from recipes.models import Follow, Recipe
 from .models import User
+from api.fieldsets import SparseFieldsMixin
+from api.timing import TimedSerializerMixin
 import api.serializers
 
 
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField()
+    avatar = images.Base64ImageField()
     class Meta:
         model = User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        upload = images.detach_upload(User, validated_data, 'avatar')
+        instance = super().update(instance, validated_data)
+        images.refresh_variants(instance, 'avatar', 'avatar_variants', 'avatar', upload)
+        return instance
+
 
 class CustomTokenCreateSerializer(TokenCreateSerializer):
     def validate(self, attrs):
@@ -26,26 +34,38 @@ class CustomTokenCreateSerializer(TokenCreateSerializer):
 
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                     serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField(required=False)
+    avatar = images.Base64ImageField(required=False)
+    avatar_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ('email', 'id', 'username', 'first_name', 'last_name', 'password', 'avatar', 'is_subscribed')
+        fields = ('email', 'id', 'username', 'first_name', 'last_name', 'password', 'avatar', 'is_subscribed',
+                  'avatar_variants')
         extra_kwargs = {'password': {'write_only': True}, 'is_subscribed': {'read_only': True}}
 
+    def get_avatar_variants(self, obj):
+        return images.variant_urls(obj.avatar_variants, self.context.get('request'))
+
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if not user.is_anonymous:
             return Follow.objects.filter(user=user, author=obj).exists()
         return False
 
     def create(self, validated_data):
-        return User.objects.create_user(**validated_data)
+        upload = images.detach_upload(User, validated_data, 'avatar')
+        user = User.objects.create_user(**validated_data)
+        images.refresh_variants(user, 'avatar', 'avatar_variants', 'avatar', upload)
+        return user
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(SparseFieldsMixin, TimedSerializerMixin,
+                       serializers.ModelSerializer):
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
     username = serializers.ReadOnlyField(source='author.username')
@@ -61,22 +81,24 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(
-                user=obj.user,
-                author=obj.author).exists()
-        return False
+        if user.is_anonymous:
+            return False
+        if obj.user_id == user.id:
+            return True
+        return Follow.objects.filter(user=user, author=obj.author).exists()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj.author, 'latest_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj.author)
+            if limit and limit.isdigit():
+                recipes = recipes[:int(limit)]
         return api.serializers.RecipeMiniSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def validate(self, data):
         author = self.context.get('author')
@@ -1,3 +1,42 @@
-from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from api.tests import (ApiTestCase, QueryBudgetMixin, SIZES, create_recipes,
+                       create_user)
+from recipes.models import Follow, Ingredient
+
+
+class SubscriptionsQueryBudgetTest(QueryBudgetMixin, ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        for number in range(max(SIZES)):
+            author = create_user(f'author{number}')
+            create_recipes(author, 3, [ingredient])
+            Follow.objects.create(user=cls.user, author=author)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_subscriptions(self):
+        self.assertConstantQueries('users-subscriptions', {
+            size: f'/api/users/subscriptions/?limit={size}&recipes_limit=2'
+            for size in SIZES})
+
+    def test_users_me(self):
+        self.measure('users-me', 1, '/api/users/me/')
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/?limit=5&recipes_limit=2')
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], 3)
+            self.assertTrue(author['is_subscribed'])
+            self.assertGreater(author['recipes'][0]['id'],
+                               author['recipes'][1]['id'])
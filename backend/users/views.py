@@ -1,3 +1,4 @@
+import copy
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
@@ -7,10 +8,15 @@ from djoser.views import TokenCreateView
 from rest_framework.exceptions import ValidationError
 from djoser.serializers import SetPasswordSerializer
 from rest_framework.permissions import IsAuthenticated
+from api.async_views import AsyncReadMixin
+from api.fieldsets import SparseFieldsViewMixin
 from api.paginations import ApiPagination
 from django.shortcuts import get_object_or_404
 from time import time
-from recipes.models import Follow
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
+from recipes import images
+from recipes.models import Follow, Recipe
 from .models import User
 from .serializers import FollowSerializer, UserSerializer, AvatarSerializer
 from api.permissions import IsCurrentUserOrAdminOrReadOnly
@@ -25,17 +31,37 @@ class CustomTokenCreateView(TokenCreateView):
                 detail['non_field_errors'] = ['Пожалуйста, введите почту и пароль.']
             return Response(detail, status=status.HTTP_400_BAD_REQUEST)
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AsyncReadMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
+    async_actions = ('me',)
+    sparse_actions = ('list', 'retrieve', 'me', 'subscriptions')
     permission_classes = (IsCurrentUserOrAdminOrReadOnly, )
     pagination_class = ApiPagination
+    cursor_ordering = ('id',)
     serializer_class = UserSerializer
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
+    def get_queryset(self):
+        user = self.request.user
+        queryset = self.queryset.order_by('id')
+        if user.is_anonymous or not self.wants('is_subscribed'):
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('pk'))))
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         user = self.request.user
-        serializer = UserSerializer(user, context={'request': request})
+        serializer = UserSerializer(user, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    async def ame(self, request):
+        # request.user может быть общим объектом из кеша токенов.
+        user = copy.copy(request.user)
+        if self.wants('is_subscribed'):
+            user.is_subscribed = await Follow.objects.filter(
+                user=user, author=user).aexists()
+        serializer = UserSerializer(user, context=self.get_serializer_context())
         return Response(serializer.data)
 
     @action(["post"], detail=False, permission_classes=[IsAuthenticated])
@@ -66,11 +92,33 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response( {'message': 'Успешная отписка', 'is_subscribed': False}, status=status.HTTP_200_OK)
         return Response({'errors': 'Объект не найден'}, status=status.HTTP_404_NOT_FOUND)
 
+    def get_subscriptions(self, request):
+        follows = (
+            Follow.objects
+            .filter(user=self.request.user)
+            .select_related('author')
+            .order_by('id')
+        )
+        if not self.wants('recipes', FollowSerializer):
+            return follows
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(), partition_by=F('author'),
+                order_by=F('id').desc())).filter(row_number__lte=int(limit))
+        return follows.prefetch_related(Prefetch(
+            'author__recipe', queryset=recipes, to_attr='latest_recipes'))
+
+    def get_subscriptions_context(self, request):
+        return {'request': request,
+                'fields': self.get_sparse_fields(FollowSerializer)}
+
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        follows = Follow.objects.filter(user=self.request.user)
-        pages = self.paginate_queryset(follows)
-        serializer = FollowSerializer(pages, many=True, context={'request': request})
+        pages = self.paginate_queryset(self.get_subscriptions(request))
+        serializer = FollowSerializer(
+            pages, many=True, context=self.get_subscriptions_context(request))
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -93,4 +141,5 @@ class UserViewSet(viewsets.ModelViewSet):
         if request.method == 'DELETE':
             user.avatar.delete(save=True)
             user.save()
+            images.refresh_variants(user, 'avatar', 'avatar_variants', 'avatar')
             return Response({'message': 'Аватар удалён'}, status=status.HTTP_200_OK)